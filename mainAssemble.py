@@ -4,21 +4,136 @@
 #   - __init__(self, master)
 #   - select_architecture(self, arch)
 #
-# AssemblerApp:
-#   - __init__(self, root, architecture)
+# BuildCache:
+#   - __init__(self, directory=None, max_bytes=64 * 1024 * 1024)
+#   - default_directory()
+#   - key(self, source, architecture, optimize=False)
+#   - get(self, key)
+#   - put(self, key, program)
+#   - evict(self)
+#   - discard(self, path)
+#
+# Profiler:
+#   - __init__(self, cpu=False, memory=False)
+#   - reset(self)
+#   - phase(self, name)
+#   - count(self, name, amount=1)
+#   - capture(self)
+#   - status_line(self)
+#   - summary(self)
+#
+# Assembler:
+#   - __init__(self, architecture, cache=None, profiler=None)
 #   - setup_riscv(self)
 #   - setup_mips(self)
-#   - create_widgets(self)
-#   - create_menu(self)
-#   - show_document(self)
-#   - open_hex_file(self)
+#   - build_decode_table(self)
+#   - decode_entry(self, word)
 #   - disassemble_instruction(self, instruction_word)
-#   - return_to_selection(self)
+#   - branch_target(self, word, pc)
+#   - reencodes(self, text, word)
+#   - disassemble_program(self, words, base=0)
 #   - sign_extend(self, val, bits)
 #   - parse_inst(self, line)
+#   - resolve_target(self, label, labels)
+#   - branch_in_range(self, label, labels, pc)
+#   - split_immediate(self, value)
+#   - expand_pseudo(self, parts, labels, pc, relaxed=False)
+#   - expand_riscv(self, parts, labels, pc, relaxed)
+#   - expand_mips(self, parts, labels, pc, relaxed)
 #   - encode_inst(self, parts, labels, pc)
 #   - encode_riscv(self, parts, labels, pc, _mem, instr, fmt)
 #   - encode_mips(self, parts, labels, pc, _mem, instr, fmt)
+#   - is_symbol(self, operand)
+#   - branch_label(self, parts)
+#   - is_redundant(self, parts)
+#   - peephole(self, entries, exported=())
+#   - assemble_program(self, asm, optimize=False)
+#   - parse_program(self, asm)
+#   - layout_program(self, entries, relaxed=None)
+#   - build_program(self, asm, optimize=False)
+#   - relocation_field(self, parts)
+#   - assemble_object(self, asm, name, optimize=False)
+#
+# Linker:
+#   - __init__(self, architecture)
+#   - add(self, obj)
+#   - remove(self, name)
+#   - resolve(self, obj, symbol, base, symbols)
+#   - relocate(self, word, kind, pc, target)
+#   - link(self)
+#   - locate(self, pc)
+#
+# Simulator:
+#   - __init__(self, assembler, words, entry=0)
+#   - reset(self)
+#   - signed(self, val, bits)
+#   - set_breakpoint(self, pc, enabled=True)
+#   - set_watchpoint(self, addr, enabled=True)
+#   - is_control_transfer(self, word)
+#   - block_lengths(self)
+#   - decode(self, pc, word)
+#   - decode_riscv(self, pc, word)
+#   - decode_mips(self, pc, word)
+#   - step(self)
+#   - check_watchpoint(self, addr, next_pc)
+#   - run(self, max_steps, stop_at=None)
+#   - run_blocks(self, max_steps)
+#
+# BatchSimulator(Simulator):
+#   - __init__(self, assembler, words, lanes, entry=0)
+#   - reset(self)
+#   - set_register(self, reg, values)
+#   - set_memory(self, addr, values)
+#   - load(self, lanes, addrs, width)
+#   - store(self, lanes, addrs, values, width)
+#   - step(self)
+#   - branch(self, lanes, taken, target, next_pc)
+#   - finish(self, lanes)
+#   - run(self, max_steps, stop_at=None)
+#
+# CycleEstimator:
+#   - __init__(self, assembler, words, source_map=None, asm=None, labels=None)
+#   - loop_bounds(self, source_map, asm)
+#   - build_blocks(self)
+#   - target_block(self, target)
+#   - estimate(self)
+#   - function(self, entry, active=None)
+#   - reachable(self, entry)
+#   - paths(self, start, members, rep, best, worst, succ, skip=None)
+#
+# ProgramGenerator:
+#   - __init__(self, architecture, seed=0)
+#   - new_label(self, prefix)
+#   - immediate(self, name)
+#   - alu_op(self)
+#   - memory_op(self)
+#   - call(self, function)
+#   - jump(self, label)
+#   - ret(self)
+#   - block(self, lines, size, depth, functions)
+#   - generate(self, count)
+#
+# AssemblerService:
+#   - __init__(self, cache_dir=None, use_cache=True)
+#   - handle(self, request)
+#
+# ServiceClient:
+#   - __init__(self, socket_path=None, port=None, timeout=None)
+#   - call(self, op, **fields)
+#   - recv_exact(self, count)
+#   - close(self)
+#
+# AssemblerApp(Assembler):
+#   - __init__(self, root, architecture)
+#   - create_widgets(self)
+#   - create_menu(self)
+#   - show_document(self)
+#   - show_profile(self)
+#   - open_hex_file(self)
+#   - open_image_file(self)
+#   - show_disassembly(self, words, base=0)
+#   - save_image_file(self)
+#   - return_to_selection(self)
 #   - show_docs(self)
 #   - save_hex_file(self)
 #   - clear_all(self)
@@ -26,17 +141,252 @@
 #   - load_example(self, example_name)
 #   - copy_selected(self)
 #   - assemble_all(self)
+#   - assemble_and_render(self)
+#   - debug_reset(self)
+#   - load_program(self)
+#   - debug_run(self, stop_at=None, max_cycles=None)
+#   - debug_pause(self)
+#   - debug_step(self)
+#   - cursor_instruction_line(self)
+#   - debug_run_to_cursor(self)
+#   - toggle_breakpoint(self)
+#   - toggle_watchpoint(self)
+#   - debug_tick(self)
+#   - refresh_debug_view(self)
 #
 # Global Functions:
 #   - show_arch_selection()
-#   - main()
+#   - encode_frame(message)
+#   - init_service(cache_dir=None, use_cache=True)
+#   - handle_service_request(request)
+#   - serve(socket_path=None, port=8765, jobs=None, cache_dir=None, use_cache=True)
+#   - write_hex(path, words)
+#   - read_hex(path)
+#   - atomic_open(path, mode="w")
+#   - write_image(path, architecture, words, base=0, entry=None, source_map=None)
+#   - load_image(path)
+#   - close_image(image)
+#   - convert_file(path, architecture, output=None)
+#   - disassemble_file(path, architecture, output=None, profiler=None)
+#   - save_object(obj, path)
+#   - load_object(path)
+#   - compile_object(assembler, source, optimize=False)
+#   - write_output(path, architecture, words, image_format=False, source_map=None)
+#   - link_files(sources, architecture, output=None, optimize=False, image_format=False, profiler=None)
+#   - assemble_files(sources, architecture, output=None, optimize=False, cache=None, image_format=False,
+#                    profiler=None)
+#   - report_cycles(sources, architecture, optimize=False, profiler=None)
+#   - main(argv=None)
+#   - run_build(parser, args, profiler)
 # ------------------
 
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import re
 from collections import namedtuple
 import webbrowser
+import time
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import argparse
+import asyncio
+import socket
+import mmap
+import struct
+import io
+import random
+import bisect
+import cProfile
+import pstats
+import tracemalloc
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Program = namedtuple('Program', 'words source_map labels errors removed')
+ObjectFile = namedtuple('ObjectFile', 'name architecture source_hash words symbols globals relocations source_map errors')
+LinkedImage = namedtuple('LinkedImage', 'words symbols layout errors')
+ProgramImage = namedtuple('ProgramImage', 'architecture base entry sections words source_map')
+CycleEstimate = namedtuple('CycleEstimate', 'name entry best worst loops notes')
+
+# Part of every build cache key; bump whenever the encoded output changes
+ASSEMBLER_VERSION = "1.5"
+
+class WatchpointHit(Exception):
+    pass
+
+class BuildCache:
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or self.default_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def default_directory():
+        return os.environ.get("MINI_ASSEMBLER_CACHE") or \
+            os.path.join(os.path.expanduser("~"), ".cache", "mini-assembler")
+
+    @staticmethod
+    def key(source, architecture, optimize=False):
+        digest = hashlib.sha256()
+        for field in (ASSEMBLER_VERSION, architecture, str(bool(optimize)), source):
+            digest.update(field.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.directory, key + ".json")
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            program = Program(
+                data["words"],
+                {int(pc): line_num for pc, line_num in data["source_map"].items()},
+                data["labels"],
+                [tuple(error) for error in data["errors"]],
+                data["removed"],
+            )
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            # A corrupt or half-written entry is just a miss
+            self.misses += 1
+            self.discard(path)
+            return None
+
+        # The modification time doubles as the LRU timestamp
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return program
+
+    def put(self, key, program):
+        data = {
+            "words": list(program.words),
+            "source_map": program.source_map,
+            "labels": program.labels,
+            "errors": program.errors,
+            "removed": program.removed,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, os.path.join(self.directory, key + ".json"))
+        except OSError:
+            self.discard(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class Profiler:
+    # Phase timers and counters are always on and cost two clock reads per
+    # phase; cProfile and tracemalloc only run inside capture() and only
+    # when asked for.
+    def __init__(self, cpu=False, memory=False):
+        self.cpu = cpu
+        self.memory = memory
+        self.reset()
+
+    def reset(self):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.cpu_report = None
+        self.memory_report = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def capture(self):
+        profile = cProfile.Profile() if self.cpu else None
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                tracemalloc.stop()
+                self.memory_report = "\n".join([f"peak traced memory: {peak / 1024:.1f} KiB"] +
+                                               [str(stat) for stat in top])
+            if profile:
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(20)
+                self.cpu_report = out.getvalue()
+
+    def status_line(self):
+        phases = ", ".join(f"{name} {self.times[name] * 1000:.1f} ms" for name in self.times)
+        counters = ", ".join(f"{self.counters[name]} {name}" for name in self.counters)
+        return " | ".join(part for part in (phases, counters) if part) or "No timings recorded"
+
+    def summary(self):
+        lines = [f"{'phase':<16}{'calls':>8}{'total ms':>12}{'avg ms':>10}"]
+        for name, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f"{name:<16}{calls:>8}{seconds * 1000:>12.2f}{seconds * 1000 / calls:>10.3f}")
+        if self.counters:
+            lines.append("")
+            for name in sorted(self.counters):
+                lines.append(f"{name:<16}{self.counters[name]:>8}")
+        if self.cpu_report:
+            lines += ["", self.cpu_report.strip()]
+        if self.memory_report:
+            lines += ["", self.memory_report]
+        return "\n".join(lines)
 
 class ArchSelectionWindow:
     def __init__(self, master):
@@ -97,77 +447,77 @@ class ArchSelectionWindow:
         self.selected_arch = arch
         self.master.destroy()
 
-class AssemblerApp:
-    def __init__(self, root, architecture):
-        self.root = root
+class Assembler:
+    def __init__(self, architecture, cache=None, profiler=None):
         self.architecture = architecture
-        self.root.title(f"{architecture} Mini Assembler")
-
-        # Define colors for the main application
-        self.background_color = "#E0F2F7"  # Light blue/off-white
-        self.header_color = "#34495E" # Darker blue for headers/labels
-        self.text_area_bg = "#FFFFFF" # White for text boxes
-        self.text_area_fg = "#2C3E50" # Dark blue/navy for text
-        self.button_bg_color = "#3498DB"  # Medium blue
-        self.button_fg_color = "#FFFFFF"  # White
-
-        self.root.configure(bg=self.background_color)
+        self.cache = cache
+        self.profiler = profiler or Profiler()
 
         if architecture == "RISC-V":
             self.setup_riscv()
         else:
             self.setup_mips()
 
-        self.create_widgets()
-        self.create_menu()
-
-        self.assembled = []
-        self.hex_map = {}
-
-        self.documentation_url = "https://riscv.org/about/" if architecture == "RISC-V" else "https://www.mips.com/"
-
     def setup_riscv(self):
         Instr = namedtuple('Instr', 'fmt opcode funct3 funct7')
 
+        # The whole of RV32I (plus mul). Formats by operand syntax:
+        #   R  rd, rs1, rs2        I  rd, rs1, imm       IS rd, rs1, shamt
+        #   L  rd, imm(rs1)        S  rs2, imm(rs1)      SB rs1, rs2, label
+        #   U  rd, imm20           UJ rd, label          N  (no operands)
+        # For IS funct7 is imm[11:5]; for N it is the whole 12-bit immediate.
         self.OPCODES = {
-            'add':  Instr('R', 0x33, 0b000, 0b0000000),
-            'sub':  Instr('R', 0x33, 0b000, 0b0100000),
-            'sll':  Instr('R', 0x33, 0b001, 0b0000000),
-            'slt':  Instr('R', 0x33, 0b010, 0b0000000),
-            'sltu': Instr('R', 0x33, 0b011, 0b0000000),
-            'xor':  Instr('R', 0x33, 0b100, 0b0000000),
-            'srl':  Instr('R', 0x33, 0b101, 0b0000000),
-            'sra':  Instr('R', 0x33, 0b101, 0b0100000),
-            'or':   Instr('R', 0x33, 0b110, 0b0000000),
-            'and':  Instr('R', 0x33, 0b111, 0b0000000),
-            'mul':  Instr('R', 0x33, 0b000, 0b0000001),
-            'addi': Instr('I', 0x13, 0b000, None),
-            'lw':   Instr('I', 0x03, 0b010, None),
-            'jalr': Instr('I', 0x67, 0b000, None),
-            'sw':   Instr('S', 0x23, 0b010, None),
-            'beq':  Instr('SB',0x63, 0b000, None),
-            'blt':  Instr('SB',0x63, 0b100, None),
-            'jal':  Instr('UJ',0x6F, None, None),
-            'j':    Instr('UJ',0x6F, None, None),
+            'add':   Instr('R', 0x33, 0b000, 0b0000000),
+            'sub':   Instr('R', 0x33, 0b000, 0b0100000),
+            'sll':   Instr('R', 0x33, 0b001, 0b0000000),
+            'slt':   Instr('R', 0x33, 0b010, 0b0000000),
+            'sltu':  Instr('R', 0x33, 0b011, 0b0000000),
+            'xor':   Instr('R', 0x33, 0b100, 0b0000000),
+            'srl':   Instr('R', 0x33, 0b101, 0b0000000),
+            'sra':   Instr('R', 0x33, 0b101, 0b0100000),
+            'or':    Instr('R', 0x33, 0b110, 0b0000000),
+            'and':   Instr('R', 0x33, 0b111, 0b0000000),
+            'mul':   Instr('R', 0x33, 0b000, 0b0000001),
+            'addi':  Instr('I', 0x13, 0b000, None),
+            'slti':  Instr('I', 0x13, 0b010, None),
+            'sltiu': Instr('I', 0x13, 0b011, None),
+            'xori':  Instr('I', 0x13, 0b100, None),
+            'ori':   Instr('I', 0x13, 0b110, None),
+            'andi':  Instr('I', 0x13, 0b111, None),
+            'slli':  Instr('IS',0x13, 0b001, 0b0000000),
+            'srli':  Instr('IS',0x13, 0b101, 0b0000000),
+            'srai':  Instr('IS',0x13, 0b101, 0b0100000),
+            'lb':    Instr('L', 0x03, 0b000, None),
+            'lh':    Instr('L', 0x03, 0b001, None),
+            'lw':    Instr('L', 0x03, 0b010, None),
+            'lbu':   Instr('L', 0x03, 0b100, None),
+            'lhu':   Instr('L', 0x03, 0b101, None),
+            'jalr':  Instr('L', 0x67, 0b000, None),
+            'sb':    Instr('S', 0x23, 0b000, None),
+            'sh':    Instr('S', 0x23, 0b001, None),
+            'sw':    Instr('S', 0x23, 0b010, None),
+            'beq':   Instr('SB',0x63, 0b000, None),
+            'bne':   Instr('SB',0x63, 0b001, None),
+            'blt':   Instr('SB',0x63, 0b100, None),
+            'bge':   Instr('SB',0x63, 0b101, None),
+            'bltu':  Instr('SB',0x63, 0b110, None),
+            'bgeu':  Instr('SB',0x63, 0b111, None),
+            'lui':   Instr('U', 0x37, None, None),
+            'auipc': Instr('U', 0x17, None, None),
+            'jal':   Instr('UJ',0x6F, None, None),
+            'fence': Instr('N', 0x0F, 0b000, None),
+            'ecall': Instr('N', 0x73, 0b000, 0x000),
+            'ebreak':Instr('N', 0x73, 0b000, 0x001),
         }
 
+        # Expanded by expand_pseudo() before encoding
+        self.PSEUDO_OPS = ['li', 'la', 'mv', 'nop', 'j', 'bgt', 'ble', 'call', 'ret']
+        self.BRANCH_OPS = [name for name, instr in self.OPCODES.items() if instr.fmt == 'SB'] + ['bgt', 'ble']
+
         self.REGS = {f'x{i}': i for i in range(32)}
         self.REV_REGS = {v: k for k, v in self.REGS.items()}
 
-        self.REV_OPCODES = {}
-        for name, instr in self.OPCODES.items():
-            if instr.fmt == 'R':
-                key = (instr.opcode, instr.funct3, instr.funct7)
-            elif instr.fmt == 'I':
-                key = (instr.opcode, instr.funct3)
-            elif instr.fmt == 'S':
-                key = (instr.opcode, instr.funct3)
-            elif instr.fmt == 'SB':
-                key = (instr.opcode, instr.funct3)
-            elif instr.fmt == 'UJ':
-                key = (instr.opcode,)
-            self.REV_OPCODES[key] = (name, instr.fmt)
-
+        self.DECODE = self.build_decode_table()
 
         self.EXAMPLES = {
             "Basic Arithmetic": "addi x1, x0, 10\naddi x2, x0, 20\nadd x3, x1, x2\nsub x4, x2, x1\nsll x5, x1, x2 # x5 = x1 << x2 (10 << 20)\nsrl x6, x2, x1 # x6 = x2 >> x1 (20 >> 10)\nsra x7, x2, x1 # x7 = x2 >> x1 (arithmetic shift)\nslt x8, x1, x2 # x8 = 1 if x1 < x2 else 0\nsltu x9, x2, x1 # x9 = 1 if x2 < x1 (unsigned) else 0\nxor x10, x1, x2\nor x11, x1, x2\nand x12, x1, x2",
@@ -191,13 +541,19 @@ class AssemblerApp:
             'addi': Instr('I', 0x08, None),
             'lw':   Instr('I', 0x23, None),
             'sw':   Instr('I', 0x2B, None),
+            'ori':  Instr('I', 0x0D, None),
+            'lui':  Instr('I', 0x0F, None),
             'beq':  Instr('I', 0x04, None),
-            'blt':  Instr('I', 0x01, None),
+            'bne':  Instr('I', 0x05, None),
             'j':    Instr('J', 0x02, None),
             'jal':  Instr('J', 0x03, None),
             'jr':   Instr('R', 0x00, 0x08),
         }
 
+        # Expanded by expand_pseudo() before encoding
+        self.PSEUDO_OPS = ['li', 'la', 'mv', 'nop', 'blt', 'bgt', 'ble', 'call', 'ret']
+        self.BRANCH_OPS = ['beq', 'bne', 'blt', 'bgt', 'ble']
+
         self.REGS = {
             '$zero': 0, '$at': 1, '$v0': 2, '$v1': 3,
             '$a0': 4, '$a1': 5, '$a2': 6, '$a3': 7,
@@ -227,191 +583,62 @@ class AssemblerApp:
             "Function Call": "main:\naddi $a0, $zero, 5\njal factorial\nj end\n\nfactorial:\naddi $v0, $zero, 1\naddi $t0, $zero, 1\nfact_loop:\nblt $t0, $a0, fact_continue\nj fact_end\nfact_continue:\nmul $v0, $v0, $t0\naddi $t0, $t0, 1\nj fact_loop\n\nfact_end:\njr $ra\n\nend:"
         }
 
-    def create_widgets(self):
-        self.font_family = "Berlin Sans FB Demi"
-        self.font_size = 12
-        self.font = (self.font_family, self.font_size)
-
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure('TFrame', background=self.background_color)
-        style.configure('TLabel', background=self.background_color, foreground=self.header_color, font=self.font)
-        style.configure('TButton', font=(self.font_family, 10), background=self.button_bg_color, foreground=self.button_fg_color, relief="flat")
-        style.map('TButton',
-                  background=[('active', '#21618C')],
-                  foreground=[('active', self.button_fg_color)])
-
-        # Style for Text widgets
-        self.root.option_add('*Text*Background', self.text_area_bg)
-        self.root.option_add('*Text*Foreground', self.text_area_fg)
-        self.root.option_add('*Text*Font', self.font)
-        self.root.option_add('*Text*Borderwidth', 1)
-        self.root.option_add('*Text*Relief', 'solid')
-        self.root.option_add('*Text*BorderColor', '#BDC3C7') # Light gray border
-
-        self.frame = ttk.Frame(self.root, padding=10)
-        self.frame.pack(fill="both", expand=True)
-
-        ttk.Label(self.frame, text="Instructions").pack(anchor="w")
-        self.input_box = tk.Text(self.frame, height=8, width=70)
-        self.input_box.pack(fill="x", pady=(0, 10))
-
-        output_frame = ttk.Frame(self.frame)
-        output_frame.pack(fill="both", expand=True)
-
-        left_frame = ttk.Frame(output_frame)
-        left_frame.pack(side="left", fill="both", expand=True, padx=(0,5))
-
-        ttk.Label(left_frame, text="Assembled Output").pack(anchor="w")
-        self.output_box = tk.Text(left_frame, height=15, width=40)
-        self.output_box.pack(fill="both", expand=True)
-
-        right_frame = ttk.Frame(output_frame)
-        right_frame.pack(side="left", fill="both", expand=True, padx=(5,0))
-
-        ttk.Label(right_frame, text="Register Values (Terminal)").pack(anchor="w")
-        self.terminal_box = tk.Text(right_frame, height=15, width=30)
-        self.terminal_box.pack(fill="both", expand=True)
-
-        bottom_frame = ttk.Frame(self.frame)
-        bottom_frame.pack(fill="x", pady=10)
-
-        style.configure('Back.TButton', font=(self.font_family, 10),
-                        background="#E74C3C", foreground=self.button_fg_color, relief="flat") # A red for 'Back'
-        style.map('Back.TButton',
-                  background=[('active', '#C0392B')])
-
-        self.back_btn = ttk.Button(bottom_frame, text="← Back",
-                                    style='Back.TButton', command=self.return_to_selection)
-        self.back_btn.pack(side="left", padx=(0, 5))
-
-        # Styling for OptionMenu
-        style.configure('TMenubutton', font=(self.font_family, 10), background=self.button_bg_color, foreground=self.button_fg_color, relief="flat")
-        style.map('TMenubutton',
-                  background=[('active', '#21618C')],
-                  foreground=[('active', self.button_fg_color)])
-
-        self.selected_var = tk.StringVar(value="Select instruction")
-        self.copy_menu = ttk.OptionMenu(bottom_frame, self.selected_var, "Select instruction")
-        self.copy_menu.pack(side="left", padx=(0, 5))
-
-        copy_btn = ttk.Button(bottom_frame, text="Copy Hex", command=self.copy_selected)
-        copy_btn.pack(side="left", padx=(0, 5))
-
-        self.assemble_btn = ttk.Button(bottom_frame, text="Assemble", command=self.assemble_all)
-        self.assemble_btn.pack(side="right")
-
-    def create_menu(self):
-        self.menubar = tk.Menu(self.root, bg=self.button_bg_color, fg=self.button_fg_color)
-        self.root.config(menu=self.menubar)
-
-        # Style for Menu items
-        menu_font = (self.font_family, 10)
-        file_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
-        file_menu.add_command(label="Open Hex File", command=self.open_hex_file)
-        file_menu.add_command(label="Documentation", command=self.show_docs)
-        file_menu.add_command(label="Save Hex", command=self.save_hex_file)
-        file_menu.add_command(label="Clear All", command=self.clear_all)
-        file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.on_exit)
-        self.menubar.add_cascade(label="File", menu=file_menu)
-
-        examples_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
-        for example_name in self.EXAMPLES:
-            examples_menu.add_command(
-                label=example_name,
-                command=lambda name=example_name: self.load_example(name)
-            )
-        self.menubar.add_cascade(label="Examples", menu=examples_menu)
-
-        help_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
-        help_menu.add_command(label="Online Help", command=lambda: webbrowser.open("https://t.me/NimaGhafari007"))
-        help_menu.add_command(label="Document", command=self.show_document)
-        self.menubar.add_cascade(label="Help", menu=help_menu)
-
-    def show_document(self):
-        messagebox.showinfo("Document", f"Opening documentation for {self.architecture} architecture.")
-        webbrowser.open(self.documentation_url)
-
-    def open_hex_file(self):
-        file_path = filedialog.askopenfilename(
-              defaultextension=".hex",
-            filetypes=[("Hex Files", "*.hex"), ("All Files", "*.*")],
-            title="Open Hex File"
-        )
-
-        if file_path:
-            self.clear_all()
-            disassembled_instructions = []
-            try:
-                with open(file_path, 'r') as f:
-                    for line in f:
-                        hex_code = line.strip()
-                        if hex_code:
-                            try:
-                                instruction_word = int(hex_code, 16)
-                                disassembled_line = self.disassemble_instruction(instruction_word)
-                                disassembled_instructions.append(f'0x{hex_code.upper()} => {disassembled_line}')
-                                self.input_box.insert(tk.END, f"{hex_code}\n")
-                            except ValueError:
-                                disassembled_instructions.append(f'0x{hex_code} => INVALID HEX FORMAT')
-                            except Exception as e:
-                                disassembled_instructions.append(f'0x{hex_code} => DISASSEMBLY ERROR: {e}')
-
-                self.output_box.insert(tk.END, "\n".join(disassembled_instructions))
-                messagebox.showinfo("Success", "Hex file loaded and partially disassembled.")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to open file: {e}")
+    def build_decode_table(self):
+        # DECODE[opcode] is None, a (name, fmt) leaf, or a list indexed by
+        # funct3 whose slots are again None, a leaf, or a dict keyed by
+        # bits 31:20 (funct7 together with rs2/shamt, which also separates
+        # ecall from ebreak). Every word decodes in at most three lookups.
+        table = [None] * 128
+        for name, instr in self.OPCODES.items():
+            leaf = (name, instr.fmt)
+            if instr.funct3 is None:
+                table[instr.opcode] = leaf
+                continue
+            if table[instr.opcode] is None:
+                table[instr.opcode] = [None] * 8
+            by_funct3 = table[instr.opcode]
+            if instr.funct7 is None:
+                by_funct3[instr.funct3] = leaf
+                continue
+            if by_funct3[instr.funct3] is None:
+                by_funct3[instr.funct3] = {}
+            if instr.fmt == 'N':
+                by_funct3[instr.funct3][instr.funct7] = leaf
+            else:
+                for low in range(32):
+                    by_funct3[instr.funct3][(instr.funct7 << 5) | low] = leaf
+        return table
+
+    def decode_entry(self, word):
+        node = self.DECODE[word & 0x7F]
+        if type(node) is list:
+            node = node[(word >> 12) & 0x7]
+            if type(node) is dict:
+                node = node.get(word >> 20)
+        return node
 
     def disassemble_instruction(self, instruction_word):
-        opcode = instruction_word & 0x7F
-
         if self.architecture == "RISC-V":
-            funct3 = (instruction_word >> 12) & 0x7
-            funct7 = (instruction_word >> 25) & 0x7F
-
-            key_r = (opcode, funct3, funct7)
-            if key_r in self.REV_OPCODES:
-                instr_name, fmt = self.REV_OPCODES[key_r]
-                rd = (instruction_word >> 7) & 0x1F
-                rs1 = (instruction_word >> 15) & 0x1F
-                rs2 = (instruction_word >> 20) & 0x1F
-                return f"{instr_name} {self.REV_REGS.get(rd, f'x{rd}')}, {self.REV_REGS.get(rs1, f'x{rs1}')}, {self.REV_REGS.get(rs2, f'x{rs2}')}"
-
-            key_i = (opcode, funct3)
-            if key_i in self.REV_OPCODES:
-                instr_name, fmt = self.REV_OPCODES[key_i]
-                rd = (instruction_word >> 7) & 0x1F
-                rs1 = (instruction_word >> 15) & 0x1F
-                imm = (instruction_word >> 20) & 0xFFF
-                imm = self.sign_extend(imm, 12)
-
-                if instr_name == 'lw':
-                    return f"{instr_name} {self.REV_REGS.get(rd, f'x{rd}')}, {imm}({self.REV_REGS.get(rs1, f'x{rs1}')})"
-                elif instr_name == 'jalr':
-                    return f"{instr_name} {self.REV_REGS.get(rd, f'x{rd}')}, {imm}({self.REV_REGS.get(rs1, f'x{rs1}')})"
-                elif instr_name == 'addi':
-                    return f"{instr_name} {self.REV_REGS.get(rd, f'x{rd}')}, {self.REV_REGS.get(rs1, f'x{rs1}')}, {imm}"
-
-            if opcode == 0x23:
-                instr_name = 'sw'
-                funct3_s = (instruction_word >> 12) & 0x7
-                if funct3_s == 0b010:
-                    imm_11_5 = (instruction_word >> 25) & 0x7F
-                    imm_4_0 = (instruction_word >> 7) & 0x1F
-                    imm = (imm_11_5 << 5) | imm_4_0
-                    imm = self.sign_extend(imm, 12)
-                    rs1 = (instruction_word >> 15) & 0x1F
-                    rs2 = (instruction_word >> 20) & 0x1F
-                    return f"{instr_name} {self.REV_REGS.get(rs2, f'x{rs2}')}, {imm}({self.REV_REGS.get(rs1, f'x{rs1}')})"
-
-            if opcode == 0x63:
-                funct3_sb = (instruction_word >> 12) & 0x7
-                instr_name = ""
-                if funct3_sb == 0b000: instr_name = 'beq'
-                elif funct3_sb == 0b100: instr_name = 'blt'
-
-                if instr_name:
+            entry = self.decode_entry(instruction_word)
+            if entry:
+                instr_name, fmt = entry
+                rd = self.REV_REGS[(instruction_word >> 7) & 0x1F]
+                rs1 = self.REV_REGS[(instruction_word >> 15) & 0x1F]
+                rs2 = self.REV_REGS[(instruction_word >> 20) & 0x1F]
+                imm = self.sign_extend(instruction_word >> 20, 12)
+
+                if fmt == 'R':
+                    return f"{instr_name} {rd}, {rs1}, {rs2}"
+                elif fmt == 'I':
+                    return f"{instr_name} {rd}, {rs1}, {imm}"
+                elif fmt == 'IS':
+                    return f"{instr_name} {rd}, {rs1}, {(instruction_word >> 20) & 0x1F}"
+                elif fmt == 'L':
+                    return f"{instr_name} {rd}, {imm}({rs1})"
+                elif fmt == 'S':
+                    imm = self.sign_extend(((instruction_word >> 25) << 5) | ((instruction_word >> 7) & 0x1F), 12)
+                    return f"{instr_name} {rs2}, {imm}({rs1})"
+                elif fmt == 'SB':
                     imm_12 = (instruction_word >> 31) & 0x1
                     imm_10_5 = (instruction_word >> 25) & 0x3F
                     imm_4_1 = (instruction_word >> 8) & 0xF
@@ -419,28 +646,26 @@ class AssemblerApp:
 
                     offset = (imm_12 << 12) | (imm_11 << 11) | (imm_10_5 << 5) | (imm_4_1 << 1)
                     offset = self.sign_extend(offset, 13)
-
-                    rs1 = (instruction_word >> 15) & 0x1F
-                    rs2 = (instruction_word >> 20) & 0x1F
-                    return f"{instr_name} {self.REV_REGS.get(rs1, f'x{rs1}')}, {self.REV_REGS.get(rs2, f'x{rs2}')}, {offset}"
-
-            if opcode == 0x6F:
-                instr_name = 'jal'
-                rd = (instruction_word >> 7) & 0x1F
-
-                imm_20 = (instruction_word >> 31) & 0x1
-                imm_10_1 = (instruction_word >> 21) & 0x3FF
-                imm_11 = (instruction_word >> 20) & 0x1
-                imm_19_12 = (instruction_word >> 12) & 0xFF
-
-                offset = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
-                offset = self.sign_extend(offset, 21)
-
-                if rd == 0:
-                    return f"j {offset}"
-                return f"{instr_name} {self.REV_REGS.get(rd, f'x{rd}')}, {offset}"
+                    return f"{instr_name} {rs1}, {rs2}, {offset}"
+                elif fmt == 'U':
+                    return f"{instr_name} {rd}, 0x{instruction_word >> 12:x}"
+                elif fmt == 'UJ':
+                    imm_20 = (instruction_word >> 31) & 0x1
+                    imm_10_1 = (instruction_word >> 21) & 0x3FF
+                    imm_11 = (instruction_word >> 20) & 0x1
+                    imm_19_12 = (instruction_word >> 12) & 0xFF
+
+                    offset = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
+                    offset = self.sign_extend(offset, 21)
+
+                    if rd == self.REV_REGS[0]:
+                        return f"j {offset}"
+                    return f"{instr_name} {rd}, {offset}"
+                elif fmt == 'N':
+                    return instr_name
 
         elif self.architecture == "MIPS":
+            opcode = (instruction_word >> 26) & 0x3F
             if opcode == 0x00:
                 funct = instruction_word & 0x3F
                 shamt = (instruction_word >> 6) & 0x1F
@@ -473,7 +698,11 @@ class AssemblerApp:
                     return f"{instr_name} {self.REV_REGS.get(rt, f'${rt}')}, {imm}({self.REV_REGS.get(rs, f'${rs}')})"
                 elif instr_name == 'addi':
                     return f"{instr_name} {self.REV_REGS.get(rt, f'${rt}')}, {self.REV_REGS.get(rs, f'${rs}')}, {imm}"
-                elif instr_name == 'beq':
+                elif instr_name == 'ori':
+                    return f"{instr_name} {self.REV_REGS.get(rt, f'${rt}')}, {self.REV_REGS.get(rs, f'${rs}')}, 0x{instruction_word & 0xFFFF:x}"
+                elif instr_name == 'lui':
+                    return f"{instr_name} {self.REV_REGS.get(rt, f'${rt}')}, 0x{instruction_word & 0xFFFF:x}"
+                elif instr_name in ['beq', 'bne']:
                     return f"{instr_name} {self.REV_REGS.get(rs, f'${rs}')}, {self.REV_REGS.get(rt, f'${rt}')}, {imm}"
 
             opcode_j = (instruction_word >> 26) & 0x3F
@@ -485,16 +714,104 @@ class AssemblerApp:
 
         return f"UNKNOWN_INSTRUCTION: 0x{instruction_word:08x}"
 
+    def branch_target(self, word, pc):
+        # Absolute target of a direct branch or jump at pc, else None
+        if self.architecture == "RISC-V":
+            entry = self.decode_entry(word)
+            if entry is None:
+                return None
+            if entry[1] == 'SB':
+                offset = ((word >> 31) << 12) | (((word >> 7) & 0x1) << 11) | \
+                         (((word >> 25) & 0x3F) << 5) | (((word >> 8) & 0xF) << 1)
+                return (pc + self.sign_extend(offset, 13)) & 0xFFFFFFFF
+            if entry[1] == 'UJ':
+                offset = ((word >> 31) << 20) | (((word >> 12) & 0xFF) << 12) | \
+                         (((word >> 20) & 0x1) << 11) | (((word >> 21) & 0x3FF) << 1)
+                return (pc + self.sign_extend(offset, 21)) & 0xFFFFFFFF
+            return None
 
-    def return_to_selection(self):
-        if messagebox.askyesno("Confirmation", "Return to architecture selection? Current work will be lost."):
-            self.root.destroy()
-            show_arch_selection()
+        opcode = word >> 26
+        if opcode in [self.OPCODES['beq'].opcode, self.OPCODES['bne'].opcode]:
+            return (pc + 4 + self.sign_extend(word & 0xFFFF, 16) * 4) & 0xFFFFFFFF
+        if opcode in [self.OPCODES['j'].opcode, self.OPCODES['jal'].opcode]:
+            return (word & 0x3FFFFFF) << 2
+        return None
+
+    def reencodes(self, text, word):
+        # Branch operands are still numeric here, so the encoding does not
+        # depend on the pc
+        try:
+            parts = self.parse_inst(text)
+            codes = [self.encode_inst(real_parts, {}, 0) for real_parts in self.expand_pseudo(parts, {}, 0)]
+        except Exception:
+            return False
+        return codes == [word]
+
+    def disassemble_program(self, words, base=0):
+        # Returns source lines that assemble back to words. One pass decodes
+        # each distinct word once and collects the branch and jump targets
+        # that land inside the image (or just past its end); the sorted
+        # targets are then merged into the listing as labels. Words that do
+        # not decode, or would not encode back bit for bit, are written as
+        # .word; only formats with don't-care bits (the RISC-V fence/ecall/
+        # ebreak group, MIPS R-type and lui) need reencoding to check that.
+        # MIPS j/jal hold absolute addresses, so with a nonzero base their
+        # targets stay numeric.
+        if self.architecture == "RISC-V":
+            loose = {name for name, instr in self.OPCODES.items() if instr.fmt == 'N'}
+        else:
+            loose = {name for name, instr in self.OPCODES.items() if instr.fmt == 'R'} | {'lui'}
+
+        with self.profiler.phase("disassemble"):
+            texts = {}
+            lines = []
+            targets = []
+            end = base + len(words) * 4
+            absolute = []
+            if base and self.architecture == "MIPS":
+                absolute = [self.OPCODES['j'].opcode, self.OPCODES['jal'].opcode]
+            for index, word in enumerate(words):
+                known = texts.get(word)
+                if known is None:
+                    text = self.disassemble_instruction(word)
+                    if text.startswith("UNKNOWN_INSTRUCTION") or \
+                            (text.split(' ', 1)[0] in loose and not self.reencodes(text, word)):
+                        text = f".word 0x{word:08x}"
+                    branch = text[0] != '.' and word >> 26 not in absolute and \
+                        self.branch_target(word, 0) is not None
+                    known = texts[word] = (text, branch)
+
+                text, branch = known
+                target = None
+                if branch:
+                    target = self.branch_target(word, base + index * 4)
+                    if target & 3 or not base <= target <= end:
+                        target = None
+                    else:
+                        targets.append(target)
+                lines.append((text, target))
+
+            order = sorted(set(targets))
+            names = {target: f"L_{target:04x}" for target in order}
+            source = []
+            next_target = 0
+            for index, (text, target) in enumerate(lines):
+                if next_target < len(order) and order[next_target] == base + index * 4:
+                    source.append(f"{names[order[next_target]]}:")
+                    next_target += 1
+                if target is not None:
+                    text = f"{text.rsplit(' ', 1)[0]} {names[target]}"
+                source.append(f"    {text}")
+            if next_target < len(order):
+                source.append(f"{names[order[next_target]]}:")
+        self.profiler.count("disassembled", len(words))
+        return source
 
     def sign_extend(self, val, bits):
+        val &= (1 << bits) - 1
         if val & (1 << (bits - 1)):
-            val = val - (1 << bits)
-        return val & 0xFFFFFFFF
+            val -= 1 << bits
+        return val
 
     def parse_inst(self, line):
         line = re.sub(r'#.*', '', line).strip()
@@ -513,20 +830,14 @@ class AssemblerApp:
             return parts
 
         if self.architecture == "RISC-V":
-            if line.split()[0] in ['lw', 'sw', 'jalr']:
+            instr = self.OPCODES.get(line.split()[0])
+            if instr and instr.fmt in ['L', 'S']:
                 m = re.match(r'(\w+)\s+(\w+)\s*,\s*(-?\d+)\((\w+)\)', line)
                 if m:
-                    if m.group(1) == 'sw':
-                        return [m.group(1), m.group(2), m.group(4), m.group(3)]
-                    else:
-                        return [m.group(1), m.group(2), m.group(4), m.group(3)]
-            elif line.split()[0] == 'j':
-                m = re.match(r'j\s+(\w+)', line)
-                if m:
-                    return ['jal', 'x0', m.group(1)]
+                    return [m.group(1), m.group(2), m.group(4), m.group(3)]
         else:
             if line.split()[0] in ['lw', 'sw']:
-                m = re.match(r'(\w+)\s+(\w+)\s*,\s*(-?\d+)\((\w+)\)', line)
+                m = re.match(r'(\w+)\s+([\w$]+)\s*,\s*(-?\d+)\(([\w$]+)\)', line)
                 if m:
                     return [m.group(1), m.group(2), m.group(4), m.group(3)]
             elif line.split()[0] in ['sll', 'srl', 'sra']:
@@ -537,8 +848,135 @@ class AssemblerApp:
         parts = line.replace(',', ' ').split()
         return parts
 
+    def resolve_target(self, label, labels):
+        if label in labels:
+            return labels[label], True
+        # A bare number is an offset in the same form the disassembler prints
+        try:
+            return int(label, 0), False
+        except ValueError:
+            raise ValueError(f'Label "{label}" not found') from None
+
+    def branch_in_range(self, label, labels, pc):
+        if not labels or label not in labels:
+            return True
+        offset = labels[label] - pc
+        if self.architecture == "RISC-V":
+            return -4096 <= offset < 4096
+        return -32768 <= (offset - 4) // 4 < 32768
+
+    def split_immediate(self, value):
+        # Returns the (upper, lower) halves loaded by lui and addi/ori
+        value &= 0xFFFFFFFF
+        if self.architecture == "RISC-V":
+            lo = ((value & 0xFFF) ^ 0x800) - 0x800
+            return ((value - lo) >> 12) & 0xFFFFF, lo
+        return value >> 16, value & 0xFFFF
+
+    def expand_pseudo(self, parts, labels, pc, relaxed=False):
+        # Returns the list of real instructions for parts. labels is None
+        # while sizing the program for the first time; relaxed forces the
+        # long form of anything whose size depends on where labels end up.
+        if self.architecture == "RISC-V":
+            return self.expand_riscv(parts, labels, pc, relaxed)
+        else:
+            return self.expand_mips(parts, labels, pc, relaxed)
+
+    def expand_riscv(self, parts, labels, pc, relaxed):
+        _mem = parts[0]
+
+        if _mem == 'nop':
+            return [['addi', 'x0', 'x0', '0']]
+        elif _mem == 'mv':
+            return [['addi', parts[1], parts[2], '0']]
+        elif _mem == 'j':
+            return [['jal', 'x0', parts[1]]]
+        elif _mem == 'call':
+            return [['jal', 'x1', parts[1]]]
+        elif _mem == 'ret':
+            return [['jalr', 'x0', 'x1', '0']]
+
+        elif _mem in ['li', 'la']:
+            rd = parts[1]
+            if _mem == 'la':
+                value = self.resolve_target(parts[2], labels)[0] if labels else 0
+            else:
+                value = int(parts[2], 0)
+            value = ((value & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+            hi, lo = self.split_immediate(value)
+            if not relaxed and -2048 <= value < 2048:
+                return [['addi', rd, 'x0', str(value)]]
+            if not relaxed and lo == 0:
+                return [['lui', rd, hex(hi)]]
+            return [['lui', rd, hex(hi)], ['addi', rd, rd, str(lo)]]
+
+        elif _mem in self.BRANCH_OPS:
+            rs1, rs2, label = parts[1:4]
+            if _mem == 'bgt':
+                _mem, rs1, rs2 = 'blt', rs2, rs1
+            elif _mem == 'ble':
+                _mem, rs1, rs2 = 'bge', rs2, rs1
+            if not relaxed and self.branch_in_range(label, labels, pc):
+                return [[_mem, rs1, rs2, label]]
+            inverse = {'beq': 'bne', 'bne': 'beq', 'blt': 'bge', 'bge': 'blt',
+                       'bltu': 'bgeu', 'bgeu': 'bltu'}[_mem]
+            return [[inverse, rs1, rs2, '8'], ['jal', 'x0', label]]
+
+        return [parts]
+
+    def expand_mips(self, parts, labels, pc, relaxed):
+        _mem = parts[0]
+
+        if _mem == 'nop':
+            return [['sll', '$zero', '$zero', '0']]
+        elif _mem == 'mv':
+            return [['add', parts[1], parts[2], '$zero']]
+        elif _mem == 'call':
+            return [['jal', parts[1]]]
+        elif _mem == 'ret':
+            return [['jr', '$ra']]
+
+        elif _mem in ['li', 'la']:
+            rt = parts[1]
+            if _mem == 'la':
+                value = self.resolve_target(parts[2], labels)[0] if labels else 0
+            else:
+                value = int(parts[2], 0)
+            value = ((value & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+            hi, lo = self.split_immediate(value)
+            if not relaxed and -32768 <= value < 32768:
+                return [['addi', rt, '$zero', str(value)]]
+            if not relaxed and hi == 0:
+                return [['ori', rt, '$zero', hex(lo)]]
+            if not relaxed and lo == 0:
+                return [['lui', rt, hex(hi)]]
+            return [['lui', rt, hex(hi)], ['ori', rt, rt, hex(lo)]]
+
+        elif _mem in ['beq', 'bne']:
+            rs, rt, label = parts[1:4]
+            if not relaxed and self.branch_in_range(label, labels, pc):
+                return [parts]
+            inverse = 'bne' if _mem == 'beq' else 'beq'
+            return [[inverse, rs, rt, '1'], ['j', label]]
+
+        elif _mem in ['blt', 'bgt', 'ble']:
+            rs, rt, label = parts[1:4]
+            # blt: $at = rs < rt, ble/bgt: $at = rt < rs
+            if _mem == 'blt':
+                slt, taken = ['slt', '$at', rs, rt], 'bne'
+            else:
+                slt, taken = ['slt', '$at', rt, rs], 'bne' if _mem == 'bgt' else 'beq'
+            if not relaxed and self.branch_in_range(label, labels, pc + 4):
+                return [slt, [taken, '$at', '$zero', label]]
+            skip = 'beq' if taken == 'bne' else 'bne'
+            return [slt, [skip, '$at', '$zero', '1'], ['j', label]]
+
+        return [parts]
+
     def encode_inst(self, parts, labels, pc):
         _mem = parts[0]
+        if _mem == '.word':
+            return int(parts[1], 0) & 0xFFFFFFFF
         instr = self.OPCODES.get(_mem)
         if not instr:
             raise ValueError(f'Unknown instruction "{_mem}"')
@@ -558,21 +996,21 @@ class AssemblerApp:
                    (self.REGS[rs2] << 20) | (self.REGS[rs1] << 15) | \
                    (funct3 << 12) | (self.REGS[rd] << 7) | instr.opcode
 
-        elif fmt == 'I':
-            if _mem == 'jalr':
-                rd, rs1, imm = parts[1], parts[2], parts[3]
-                imm_val = int(imm, 0)
-            elif _mem == 'lw':
-                rd, rs1, imm = parts[1], parts[2], parts[3]
-                imm_val = int(imm, 0)
-            else:
-                rd, rs1, imm = parts[1], parts[2], parts[3]
-                imm_val = int(imm, 0)
+        elif fmt in ['I', 'L']:
+            rd, rs1, imm = parts[1], parts[2], parts[3]
+            imm_val = int(imm, 0)
             imm_val = self.sign_extend(imm_val, 12)
             funct3 = instr.funct3
-            return (imm_val << 20) | (self.REGS[rs1] << 15) | \
+            return ((imm_val & 0xFFF) << 20) | (self.REGS[rs1] << 15) | \
                    (funct3 << 12) | (self.REGS[rd] << 7) | instr.opcode
 
+        elif fmt == 'IS':
+            rd, rs1, shamt = parts[1], parts[2], int(parts[3], 0)
+            if not 0 <= shamt < 32:
+                raise ValueError(f'Shift amount {shamt} out of range')
+            return (instr.funct7 << 25) | (shamt << 20) | (self.REGS[rs1] << 15) | \
+                   (instr.funct3 << 12) | (self.REGS[rd] << 7) | instr.opcode
+
         elif fmt == 'S':
             rs2, rs1, imm = parts[1], parts[2], parts[3]
             imm_val = int(imm, 0)
@@ -586,9 +1024,8 @@ class AssemblerApp:
 
         elif fmt == 'SB':
             rs1, rs2, label = parts[1], parts[2], parts[3]
-            if label not in labels:
-                raise ValueError(f'Label "{label}" not found')
-            offset = labels[label] - pc
+            target, is_label = self.resolve_target(label, labels)
+            offset = target - pc if is_label else target
             imm = self.sign_extend(offset, 13)
             funct3 = instr.funct3
             imm_12 = (imm >> 12) & 0x1
@@ -601,13 +1038,16 @@ class AssemblerApp:
                    (funct3 << 12) | (imm_4_1 << 8) | \
                    (imm_11 << 7) | instr.opcode
 
+        elif fmt == 'U':
+            rd, imm = parts[1], parts[2]
+            return ((int(imm, 0) & 0xFFFFF) << 12) | (self.REGS[rd] << 7) | instr.opcode
+
         elif fmt == 'UJ':
             rd = parts[1]
             label = parts[2]
 
-            if label not in labels:
-                raise ValueError(f'Label "{label}" not found')
-            offset = labels[label] - pc
+            target, is_label = self.resolve_target(label, labels)
+            offset = target - pc if is_label else target
             imm = self.sign_extend(offset, 21)
 
             imm_20 = (imm >> 20) & 0x1
@@ -618,6 +1058,11 @@ class AssemblerApp:
             return (imm_20 << 31) | (imm_10_1 << 21) | (imm_11 << 20) | \
                    (imm_19_12 << 12) | (self.REGS[rd] << 7) | instr.opcode
 
+        elif fmt == 'N':
+            # A bare fence orders everything: pred = succ = iorw
+            imm = 0x0FF if instr.funct7 is None else instr.funct7
+            return (imm << 20) | (instr.funct3 << 12) | instr.opcode
+
         raise ValueError(f'Unsupported or incomplete format for "{_mem}"')
 
     def encode_mips(self, parts, labels, pc, _mem, instr, fmt):
@@ -637,30 +1082,20 @@ class AssemblerApp:
 
         elif fmt == 'I':
             if _mem in ['lw', 'sw']:
-                rt, offset, rs = parts[1], parts[2], parts[3]
+                rt, rs, offset = parts[1], parts[2], parts[3]
                 imm_val = self.sign_extend(int(offset, 0), 16)
                 return (instr.opcode << 26) | (self.REGS[rs] << 21) | \
                        (self.REGS[rt] << 16) | (imm_val & 0xFFFF)
-            elif _mem == 'beq':
+            elif _mem in ['beq', 'bne']:
                 rs, rt, label = parts[1], parts[2], parts[3]
-                if label not in labels:
-                    raise ValueError(f'Label "{label}" not found')
-                offset = (labels[label] - pc - 4) // 4
+                target, is_label = self.resolve_target(label, labels)
+                offset = (target - pc - 4) // 4 if is_label else target
                 imm_val = self.sign_extend(offset, 16)
                 return (instr.opcode << 26) | (self.REGS[rs] << 21) | \
                        (self.REGS[rt] << 16) | (imm_val & 0xFFFF)
-            elif _mem == 'blt':
-                rs, rt, label = parts[1], parts[2], parts[3]
-                if label not in labels:
-                    raise ValueError(f'Label "{label}" not found')
-
-                slt_code = (0x00 << 26) | (self.REGS[rs] << 21) | (self.REGS[rt] << 16) | \
-                           (self.REGS['$at'] << 11) | (0x00 << 6) | 0x2A
-
-                offset_bne = (labels[label] - (pc + 8)) // 4
-                imm_val_bne = self.sign_extend(offset_bne, 16)
-                bne_code = (0x05 << 26) | (self.REGS['$at'] << 21) | (self.REGS['$zero'] << 16) | (imm_val_bne & 0xFFFF)
-                return (slt_code, bne_code)
+            elif _mem == 'lui':
+                rt, imm = parts[1], parts[2]
+                return (instr.opcode << 26) | (self.REGS[rt] << 16) | (int(imm, 0) & 0xFFFF)
             else:
                 rt, rs, imm = parts[1], parts[2], parts[3]
                 imm_val = self.sign_extend(int(imm, 0), 16)
@@ -669,44 +1104,1861 @@ class AssemblerApp:
 
         elif fmt == 'J':
             label = parts[1]
-            if label not in labels:
-                raise ValueError(f'Label "{label}" not found')
-            address = labels[label] // 4
+            address = self.resolve_target(label, labels)[0] // 4
             return (instr.opcode << 26) | (address & 0x3FFFFFF)
 
         raise ValueError(f'Unsupported or incomplete format for "{_mem}"')
 
-    def show_docs(self):
-        if self.architecture == "RISC-V":
-            webbrowser.open("https://riscv.org/about/")
-        else:
-            webbrowser.open("https://www.mips.com/")
-
-    def save_hex_file(self):
-        if not self.assembled:
-            messagebox.showwarning("Warning", "No assembled code to save")
-            return
+    def is_symbol(self, operand):
+        return not re.fullmatch(r'[-+]?\d\w*', operand)
 
-        file_path = filedialog.asksaveasfilename(
-              defaultextension=".hex",
-            filetypes=[("Hex Files", "*.hex"), ("All Files", "*.*")],
-            title="Save Hex File"
-        )
+    def branch_label(self, parts):
+        # Returns (label, conditional) for direct jumps and branches
+        _mem = parts[0]
+        if _mem == 'j' or (_mem == 'jal' and self.architecture == "RISC-V" and parts[1:2] == ['x0']):
+            return parts[-1], False
+        if _mem in self.BRANCH_OPS and len(parts) == 4:
+            return parts[3], True
+        return None, False
+
+    def is_redundant(self, parts):
+        # True for instructions with no architectural effect
+        zero = self.REV_REGS[0]
+        _mem = parts[0]
+        if len(parts) < 3:
+            return _mem == 'nop'
+        if _mem in ['mv', 'li', 'la']:
+            return parts[1] == zero or (_mem == 'mv' and parts[2] == parts[1])
 
-        if file_path:
+        # Only instructions that write parts[1] are candidates; MIPS beq/bne
+        # share format I with addi but their first operand is a source
+        instr = self.OPCODES.get(_mem)
+        if instr is None or instr.fmt not in ['R', 'I', 'IS', 'U'] or _mem in ['jr', 'jalr', 'lw', 'sw'] or \
+                self.branch_label(parts)[0] is not None:
+            return False
+        rd, operands = parts[1], parts[2:]
+        if rd == zero:
+            return True
+        if _mem in ['add', 'or', 'xor'] and operands in [[rd, zero], [zero, rd]]:
+            return True
+        if _mem in ['sub', 'sll', 'srl', 'sra'] and operands == [rd, zero]:
+            return True
+        if _mem in ['addi', 'ori', 'xori', 'sll', 'srl', 'sra', 'slli', 'srli', 'srai'] and \
+                len(operands) == 2 and operands[0] == rd:
             try:
-                with open(file_path, 'w') as f:
-                    for line in self.assembled:
-                        if '=>' in line:
-                            hex_part = line.split('=>')[1].strip()
-                            hex_to_write = hex_part.split(';')[0].strip()
-                            if hex_to_write.startswith('0x'):
-                                f.write(hex_to_write[2:] + '\n')
-                messagebox.showinfo("Success", "Hex file saved successfully")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {e}")
-
+                return int(operands[1], 0) == 0
+            except ValueError:
+                return False
+        return False
+
+    def peephole(self, entries, exported=()):
+        # entries are parse_program's (line_num, labels, parts) tuples.
+        # Returns new entries plus the line numbers of removed instructions;
+        # removed instructions keep their labels, which then mark the next
+        # instruction exactly as they would in the source. Labels defined
+        # elsewhere (in another module) are treated as opaque targets, and
+        # exported labels are entry points other modules may call.
+        entries = list(entries)
+        removed = []
+        for line_num, line_labels, parts in entries:
+            label = self.branch_label(parts)[0] if parts else None
+            if parts and parts[0] in ['j', 'jal', 'call']:
+                label = parts[-1]
+            if label is not None and not self.is_symbol(label):
+                # Numeric offsets and call targets would silently break once
+                # code moves
+                return entries, removed
+
+        # Indirect jumps are assumed to be returns; a computed jump through
+        # any other register could land anywhere and its target address is
+        # fixed, so no code may be removed or moved
+        returns = [['ret'], ['jr', '$ra'], ['jalr', 'x0', 'x1', '0']]
+        if any(parts and parts[0] in ['jr', 'jalr'] and parts[:4] not in returns
+               for line_num, line_labels, parts in entries):
+            return entries, removed
+
+        while True:
+            # Index of the instruction each label and each instruction
+            # falls through to (len(entries) means off the end)
+            following = [len(entries)] * len(entries)
+            for i in range(len(entries) - 2, -1, -1):
+                following[i] = i + 1 if entries[i + 1][2] else following[i + 1]
+            targets = {}
+            pending = []
+            for i, (line_num, line_labels, parts) in enumerate(entries):
+                pending.extend(line_labels)
+                if parts:
+                    for label in pending:
+                        targets[label] = i
+                    pending = []
+            for label in pending:
+                targets[label] = len(entries)
+
+            # Control-flow graph over instruction indices. Besides the entry
+            # point, any label used other than as a branch target (la, call)
+            # is a root since jalr/jr can reach it indirectly.
+            roots = {targets[label] for label in exported if label in targets}
+            if entries:
+                roots.add(0 if entries[0][2] else following[0])
+            for line_num, line_labels, parts in entries:
+                if parts:
+                    operands = parts[1:-1] if self.branch_label(parts)[0] is not None else parts[1:]
+                    roots.update(targets[op] for op in operands if op in targets)
+            reachable = set()
+            work = list(roots)
+            while work:
+                i = work.pop()
+                if i >= len(entries) or i in reachable:
+                    continue
+                reachable.add(i)
+                parts = entries[i][2]
+                label, conditional = self.branch_label(parts)
+                if label in targets:
+                    work.append(targets[label])
+                if label is None or conditional:
+                    if parts[0] not in ['jr', 'ret'] and \
+                            not (parts[0] == 'jalr' and parts[1] == self.REV_REGS[0]):
+                        work.append(following[i])
+
+            changed = False
+            for i, (line_num, line_labels, parts) in enumerate(entries):
+                if not parts:
+                    continue
+
+                label, conditional = self.branch_label(parts)
+                if label in targets:
+                    # Thread jump-to-jump chains through to the final target
+                    seen = {label}
+                    final = label
+                    # (instructions removed earlier in this sweep end the chain)
+                    while final in targets and targets[final] < len(entries) and entries[targets[final]][2]:
+                        next_label, next_conditional = self.branch_label(entries[targets[final]][2])
+                        if next_label is None or next_conditional or next_label in seen:
+                            break
+                        seen.add(next_label)
+                        final = next_label
+                    if final != label:
+                        parts = parts[:-1] + [final]
+                        entries[i] = (line_num, line_labels, parts)
+                        label = final
+                        changed = True
+
+                if i not in reachable or self.is_redundant(parts) or \
+                        (label in targets and targets[label] == following[i]):
+                    entries[i] = (line_num, line_labels, None)
+                    removed.append(line_num)
+                    changed = True
+
+            if not changed:
+                return entries, sorted(removed)
+
+    def assemble_program(self, asm, optimize=False):
+        if self.cache is None:
+            return self.build_program(asm, optimize)
+
+        with self.profiler.phase("cache"):
+            key = self.cache.key("\n".join(asm), self.architecture, optimize)
+            program = self.cache.get(key)
+        if program is None:
+            self.profiler.count("cache misses")
+            program = self.build_program(asm, optimize)
+            with self.profiler.phase("cache"):
+                self.cache.put(key, program)
+        else:
+            self.profiler.count("cache hits")
+        return program
+
+    def parse_program(self, asm):
+        # Returns (entries, global_names). Each entry is (line_num, labels
+        # defined on the line, parts or None); global_names holds the
+        # (line_num, name) pairs exported with .globl.
+        entries = []
+        global_names = []
+        for line_num, line in enumerate(asm):
+            line_clean = re.sub(r'#.*', '', line).strip()
+            if not line_clean:
+                continue
+
+            line_labels = []
+            if ':' in line_clean:
+                label_part, rest = line_clean.split(':', 1)
+                line_labels.append(label_part.strip())
+                line_clean = rest.strip()
+
+            if line_clean.split()[:1] in [['.globl'], ['.global']]:
+                for name in line_clean.replace(',', ' ').split()[1:]:
+                    global_names.append((line_num, name))
+                line_clean = ''
+
+            parts = self.parse_inst(line_clean) if line_clean else None
+            entries.append((line_num, line_labels, parts or None))
+        return entries, global_names
+
+    def layout_program(self, entries, relaxed=None):
+        # Relaxation: start every instruction in its shortest form and only
+        # ever grow the ones whose targets turn out to be out of range, so
+        # the layout converges after at most one pass per instruction.
+        relaxed = list(relaxed or [False] * len(entries))
+        sizes = []
+        for i, (line_num, line_labels, parts) in enumerate(entries):
+            try:
+                sizes.append(len(self.expand_pseudo(parts, None, 0, relaxed[i])) if parts else 0)
+            except Exception:
+                sizes.append(1)
+
+        while True:
+            labels = {}
+            addresses = []
+            pc = 0
+            for (line_num, line_labels, parts), size in zip(entries, sizes):
+                for label in line_labels:
+                    labels[label] = pc
+                addresses.append(pc)
+                pc += size * 4
+
+            changed = False
+            for i, (line_num, line_labels, parts) in enumerate(entries):
+                if not parts or relaxed[i]:
+                    continue
+                try:
+                    size = len(self.expand_pseudo(parts, labels, addresses[i]))
+                except Exception:
+                    continue
+                if size > sizes[i]:
+                    relaxed[i] = True
+                    sizes[i] = len(self.expand_pseudo(parts, labels, addresses[i], True))
+                    changed = True
+            if not changed:
+                return labels, addresses, sizes, relaxed
+
+    def build_program(self, asm, optimize=False):
+        profiler = self.profiler
+        with profiler.phase("parse"):
+            entries, global_names = self.parse_program(asm)
+
+        removed = []
+        if optimize:
+            with profiler.phase("optimize"):
+                entries, removed = self.peephole(entries)
+
+        with profiler.phase("layout"):
+            labels, addresses, sizes, relaxed = self.layout_program(entries)
+
+        words = []
+        source_map = {}
+        errors = []
+
+        with profiler.phase("encode"):
+            for i, (line_num, line_labels, parts) in enumerate(entries):
+                if not parts:
+                    continue
+                try:
+                    codes = []
+                    for real_parts in self.expand_pseudo(parts, labels, addresses[i], relaxed[i]):
+                        codes.append(self.encode_inst(real_parts, labels, addresses[i] + len(codes) * 4))
+                except Exception as e:
+                    errors.append((line_num, str(e)))
+                    # Keep the addresses of later lines where the layout put them
+                    codes = [0] * sizes[i]
+
+                for code in codes:
+                    source_map[len(words) * 4] = line_num
+                    words.append(code)
+
+        profiler.count("lines", len(asm))
+        profiler.count("words", len(words))
+        return Program(words, source_map, labels, errors, removed)
+
+    def relocation_field(self, parts):
+        # (kind, operand index) of the label operand a linker may patch
+        instr = self.OPCODES.get(parts[0])
+        if instr is None:
+            return None, None
+        if self.architecture == "RISC-V":
+            if instr.fmt == 'SB':
+                return 'SB', 3
+            elif instr.fmt == 'UJ':
+                return 'UJ', 2
+        elif parts[0] in ['beq', 'bne']:
+            return 'I', 3
+        elif instr.fmt == 'J':
+            return 'J', 1
+        return None, None
+
+    def assemble_object(self, asm, name, optimize=False):
+        profiler = self.profiler
+        with profiler.phase("parse"):
+            entries, global_names = self.parse_program(asm)
+        if optimize:
+            with profiler.phase("optimize"):
+                entries = self.peephole(entries, [name for line_num, name in global_names])[0]
+
+        # la always gets its long form since the address is only known at
+        # link time
+        relaxed = [bool(parts) and parts[0] == 'la' for line_num, line_labels, parts in entries]
+        with profiler.phase("layout"):
+            labels, addresses, sizes, relaxed = self.layout_program(entries, relaxed)
+
+        words = []
+        source_map = {}
+        errors = []
+        relocations = []
+
+        with profiler.phase("encode"):
+            for i, (line_num, line_labels, parts) in enumerate(entries):
+                if not parts:
+                    continue
+                pc = addresses[i]
+                try:
+                    codes = []
+                    line_relocations = []
+                    if parts[0] == 'la':
+                        expansion = self.expand_pseudo(parts, {parts[2]: 0}, pc, True)
+                        line_relocations = [[pc, 'HI', parts[2]], [pc + 4, 'LO', parts[2]]]
+                    else:
+                        expansion = self.expand_pseudo(parts, labels, pc, relaxed[i])
+
+                    for real_parts in expansion:
+                        real_pc = pc + len(codes) * 4
+                        ref_labels = labels
+                        kind, index = self.relocation_field(real_parts)
+                        if kind:
+                            symbol = real_parts[index]
+                            if symbol not in labels and self.is_symbol(symbol):
+                                # External: encode a placeholder for the linker to patch
+                                ref_labels = {symbol: 0 if kind == 'J' else real_pc}
+                                line_relocations.append([real_pc, kind, symbol])
+                            elif kind == 'J' and symbol in labels:
+                                # Absolute jumps move with the module
+                                line_relocations.append([real_pc, kind, symbol])
+                        codes.append(self.encode_inst(real_parts, ref_labels, real_pc))
+                    relocations.extend(line_relocations)
+                except Exception as e:
+                    errors.append((line_num, str(e)))
+                    codes = [0] * sizes[i]
+
+                for code in codes:
+                    source_map[len(words) * 4] = line_num
+                    words.append(code)
+
+        exported = []
+        for line_num, global_name in global_names:
+            if global_name in labels:
+                exported.append(global_name)
+            else:
+                errors.append((line_num, f'Global symbol "{global_name}" is not defined'))
+
+        source_hash = BuildCache.key("\n".join(asm), self.architecture, optimize)
+        return ObjectFile(name, self.architecture, source_hash, words, labels, exported,
+                          relocations, source_map, errors)
+
+class Linker:
+    def __init__(self, architecture):
+        self.architecture = architecture
+        self.modules = []
+        # name -> (object, base, relocation targets) from the last link,
+        # used to skip modules whose words cannot have changed
+        self.placed = {}
+        self.image = []
+        self.relinked = 0
+
+    def add(self, obj):
+        if obj.architecture != self.architecture:
+            raise ValueError(f'{obj.name} was assembled for {obj.architecture}, not {self.architecture}')
+        for i, module in enumerate(self.modules):
+            if module.name == obj.name:
+                self.modules[i] = obj
+                return
+        self.modules.append(obj)
+
+    def remove(self, name):
+        self.modules = [module for module in self.modules if module.name != name]
+
+    def resolve(self, obj, symbol, base, symbols):
+        if symbol in obj.symbols:
+            return base + obj.symbols[symbol]
+        return symbols.get(symbol)
+
+    def relocate(self, word, kind, pc, target):
+        if self.architecture == "RISC-V":
+            if kind == 'SB':
+                offset = target - pc
+                if not -4096 <= offset < 4096:
+                    raise ValueError(f'Branch at 0x{pc:08x} cannot reach 0x{target:08x}')
+                imm = offset & 0x1FFF
+                return (word & 0x01FFF07F) | (((imm >> 12) & 0x1) << 31) | (((imm >> 5) & 0x3F) << 25) | \
+                       (((imm >> 1) & 0xF) << 8) | (((imm >> 11) & 0x1) << 7)
+            elif kind == 'UJ':
+                offset = target - pc
+                if not -(1 << 20) <= offset < (1 << 20):
+                    raise ValueError(f'Jump at 0x{pc:08x} cannot reach 0x{target:08x}')
+                imm = offset & 0x1FFFFF
+                return (word & 0xFFF) | (((imm >> 20) & 0x1) << 31) | (((imm >> 1) & 0x3FF) << 21) | \
+                       (((imm >> 11) & 0x1) << 20) | (((imm >> 12) & 0xFF) << 12)
+            elif kind == 'HI':
+                return (word & 0xFFF) | ((((target + 0x800) >> 12) & 0xFFFFF) << 12)
+            elif kind == 'LO':
+                return (word & 0xFFFFF) | ((target & 0xFFF) << 20)
+        else:
+            if kind == 'I':
+                offset = (target - pc - 4) >> 2
+                if not -32768 <= offset < 32768:
+                    raise ValueError(f'Branch at 0x{pc:08x} cannot reach 0x{target:08x}')
+                return (word & 0xFFFF0000) | (offset & 0xFFFF)
+            elif kind == 'J':
+                if (pc + 4) & 0xF0000000 != target & 0xF0000000:
+                    raise ValueError(f'Jump at 0x{pc:08x} cannot reach 0x{target:08x}')
+                return (word & 0xFC000000) | ((target >> 2) & 0x3FFFFFF)
+            elif kind == 'HI':
+                return (word & 0xFFFF0000) | ((target >> 16) & 0xFFFF)
+            elif kind == 'LO':
+                return (word & 0xFFFF0000) | (target & 0xFFFF)
+        raise ValueError(f'Unknown relocation "{kind}"')
+
+    def link(self):
+        bases = []
+        pc = 0
+        for obj in self.modules:
+            bases.append(pc)
+            pc += len(obj.words) * 4
+
+        symbols = {}
+        errors = []
+        for obj, base in zip(self.modules, bases):
+            for line_num, error in obj.errors:
+                errors.append(f'{obj.name}:{line_num + 1}: {error}')
+            for name in obj.globals:
+                if name in symbols:
+                    errors.append(f'{obj.name}: duplicate symbol "{name}"')
+                else:
+                    symbols[name] = base + obj.symbols[name]
+
+        image = []
+        placed = {}
+        self.relinked = 0
+        for obj, base in zip(self.modules, bases):
+            targets = [self.resolve(obj, symbol, base, symbols) for offset, kind, symbol in obj.relocations]
+            previous = self.placed.get(obj.name)
+            if previous and previous[0] is obj and previous[1] == base and \
+                    previous[2] == targets and None not in targets:
+                image.extend(self.image[base >> 2:(base >> 2) + len(obj.words)])
+            else:
+                region = list(obj.words)
+                for (offset, kind, symbol), target in zip(obj.relocations, targets):
+                    if target is None:
+                        error = f'{obj.name}: undefined symbol "{symbol}"'
+                        if error not in errors:
+                            errors.append(error)
+                        continue
+                    try:
+                        region[offset >> 2] = self.relocate(region[offset >> 2], kind, base + offset, target)
+                    except ValueError as e:
+                        errors.append(f'{obj.name}: {e}')
+                image.extend(region)
+                self.relinked += 1
+            placed[obj.name] = (obj, base, targets)
+
+        self.image = image
+        self.placed = placed
+        return LinkedImage(image, symbols, [(base, obj.name) for obj, base in zip(self.modules, bases)], errors)
+
+    def locate(self, pc):
+        # (module name, source line) for an address in the last linked image
+        for obj in reversed(self.modules):
+            base = self.placed[obj.name][1]
+            if pc >= base:
+                line_num = obj.source_map.get(pc - base)
+                return (obj.name, line_num) if line_num is not None else None
+        return None
+
+class Simulator:
+    # Watchpoints are kept as one bitmap of word flags per 4 KiB page, so a
+    # store only looks at the bitmap when its page has a watchpoint at all.
+    PAGE_SHIFT = 12
+
+    def __init__(self, assembler, words, entry=0):
+        self.assembler = assembler
+        self.architecture = assembler.architecture
+        self.profiler = assembler.profiler
+        self.imem = words
+        self.entry = entry
+        self.decoded = [None] * len(words)
+        self.breakpoints = bytearray(len(words))
+        self.breakpoint_count = 0
+        self.block_len = None
+        self.watch_pages = {}
+        self.reset()
+
+    def reset(self):
+        self.regs = [0] * 32
+        self.memory = {}
+        self.pc = self.entry
+        self.cycles = 0
+        self.halted = False
+        self.stop_reason = None
+        # (pc, cycles) of the last breakpoint stop; the next run resumes
+        # past that one breakpoint instead of stopping on it again
+        self.breakpoint_stop = None
+
+    def set_breakpoint(self, pc, enabled=True):
+        index = pc >> 2
+        if pc & 3 or not 0 <= index < len(self.imem):
+            raise ValueError(f"No instruction at address 0x{pc:08x}")
+        if self.breakpoints[index] != enabled:
+            self.breakpoints[index] = int(enabled)
+            self.breakpoint_count += 1 if enabled else -1
+
+    def set_watchpoint(self, addr, enabled=True):
+        if addr % 4 != 0:
+            raise ValueError(f"Unaligned watchpoint address {addr}")
+        page = addr >> self.PAGE_SHIFT
+        word = (addr & ((1 << self.PAGE_SHIFT) - 1)) >> 2
+        if enabled:
+            self.watch_pages.setdefault(page, bytearray(1 << (self.PAGE_SHIFT - 2)))[word] = 1
+        elif page in self.watch_pages:
+            self.watch_pages[page][word] = 0
+            if not any(self.watch_pages[page]):
+                del self.watch_pages[page]
+
+    def is_control_transfer(self, word):
+        if self.architecture == "RISC-V":
+            return word & 0x7F in (0x63, 0x67, 0x6F, 0x73)
+        opcode = (word >> 26) & 0x3F
+        return 0x01 <= opcode <= 0x05 or (opcode == 0x00 and word & 0x3F == 0x08)
+
+    def block_lengths(self):
+        # block_len[i] is the number of instructions from i up to and
+        # including the next branch or jump, i.e. the longest run that can
+        # execute without the pc leaving straight-line code.
+        if self.block_len is None:
+            block_len = [1] * len(self.imem)
+            for index in range(len(self.imem) - 2, -1, -1):
+                if not self.is_control_transfer(self.imem[index]):
+                    block_len[index] = block_len[index + 1] + 1
+            self.block_len = block_len
+        return self.block_len
+
+    def signed(self, val, bits):
+        val &= (1 << bits) - 1
+        if val >> (bits - 1):
+            val -= 1 << bits
+        return val
+
+    def decode(self, pc, word):
+        if self.architecture == "RISC-V":
+            inst = self.decode_riscv(pc, word)
+        else:
+            inst = self.decode_mips(pc, word)
+        if inst is None:
+            raise ValueError(f"Unknown instruction 0x{word:08x} at pc 0x{pc:08x}")
+        return inst
+
+    # Decoded instructions are (name, rd, rs1, rs2, imm) tuples; branch and
+    # jump targets are resolved to absolute addresses here so the execute
+    # loop never has to look at the encoding again.
+    def decode_riscv(self, pc, word):
+        entry = self.assembler.decode_entry(word)
+        if entry is None:
+            return None
+        name, fmt = entry
+        rd = (word >> 7) & 0x1F
+        rs1 = (word >> 15) & 0x1F
+        rs2 = (word >> 20) & 0x1F
+
+        if fmt == 'R':
+            return (name, rd, rs1, rs2, 0)
+        elif fmt in ['I', 'L']:
+            return (name, rd, rs1, 0, self.signed(word >> 20, 12))
+        elif fmt == 'IS':
+            return (name, rd, rs1, 0, rs2)
+        elif fmt == 'S':
+            imm = ((word >> 25) << 5) | rd
+            return (name, 0, rs1, rs2, self.signed(imm, 12))
+        elif fmt == 'SB':
+            offset = (((word >> 31) & 0x1) << 12) | (((word >> 7) & 0x1) << 11) | \
+                     (((word >> 25) & 0x3F) << 5) | (((word >> 8) & 0xF) << 1)
+            return (name, 0, rs1, rs2, (pc + self.signed(offset, 13)) & 0xFFFFFFFF)
+        elif fmt == 'U':
+            # auipc is pc-relative, so like branch targets it is resolved here
+            imm = word & 0xFFFFF000
+            return ('lui', rd, 0, 0, (pc + imm) & 0xFFFFFFFF if name == 'auipc' else imm)
+        elif fmt == 'UJ':
+            offset = (((word >> 31) & 0x1) << 20) | (((word >> 12) & 0xFF) << 12) | \
+                     (((word >> 20) & 0x1) << 11) | (((word >> 21) & 0x3FF) << 1)
+            return ('jal', rd, 0, 0, (pc + self.signed(offset, 21)) & 0xFFFFFFFF)
+        return (name, 0, 0, 0, 0)
+
+    def decode_mips(self, pc, word):
+        rev = self.assembler.REV_OPCODES
+        opcode = (word >> 26) & 0x3F
+        rs = (word >> 21) & 0x1F
+        rt = (word >> 16) & 0x1F
+        rd = (word >> 11) & 0x1F
+        shamt = (word >> 6) & 0x1F
+        imm = self.signed(word, 16)
+
+        if opcode == 0x00:
+            entry = rev.get((opcode, word & 0x3F))
+            if entry:
+                name = entry[0]
+                if name == 'jr':
+                    return ('jalr', 0, rs, 0, 0)
+                if name in ['sll', 'srl', 'sra']:
+                    return (name + 'i', rd, rt, 0, shamt)
+                return (name, rd, rs, rt, 0)
+        else:
+            entry = rev.get((opcode,))
+            if entry:
+                name = entry[0]
+                if name in ['addi', 'lw']:
+                    return (name, rt, rs, 0, imm)
+                elif name == 'sw':
+                    return (name, 0, rs, rt, imm)
+                elif name == 'ori':
+                    return (name, rt, rs, 0, word & 0xFFFF)
+                elif name == 'lui':
+                    return (name, rt, 0, 0, (word & 0xFFFF) << 16)
+                elif name in ['beq', 'bne']:
+                    return (name, 0, rs, rt, (pc + 4 + (imm << 2)) & 0xFFFFFFFF)
+                elif name in ['j', 'jal']:
+                    target = ((pc + 4) & 0xF0000000) | ((word & 0x3FFFFFF) << 2)
+                    return ('jal', 31 if name == 'jal' else 0, 0, 0, target)
+        return None
+
+    def step(self):
+        pc = self.pc
+        index = pc >> 2
+        if pc & 3 or index >= len(self.imem):
+            self.halted = True
+            return False
+
+        inst = self.decoded[index]
+        if inst is None:
+            inst = self.decoded[index] = self.decode(pc, self.imem[index])
+            self.profiler.count("decoded")
+
+        name, rd, rs1, rs2, imm = inst
+        regs = self.regs
+        next_pc = pc + 4
+        value = 0
+
+        if name == 'addi':
+            value = regs[rs1] + imm
+        elif name == 'add':
+            value = regs[rs1] + regs[rs2]
+        elif name == 'sub':
+            value = regs[rs1] - regs[rs2]
+        elif name == 'mul':
+            value = regs[rs1] * regs[rs2]
+        elif name == 'and':
+            value = regs[rs1] & regs[rs2]
+        elif name == 'or':
+            value = regs[rs1] | regs[rs2]
+        elif name == 'xor':
+            value = regs[rs1] ^ regs[rs2]
+        elif name == 'ori':
+            value = regs[rs1] | imm
+        elif name == 'xori':
+            value = regs[rs1] ^ imm
+        elif name == 'andi':
+            value = regs[rs1] & imm
+        elif name == 'slti':
+            value = int((regs[rs1] ^ 0x80000000) - 0x80000000 < imm)
+        elif name == 'sltiu':
+            value = int(regs[rs1] < imm & 0xFFFFFFFF)
+        elif name == 'lui':
+            value = imm
+        elif name == 'sll':
+            value = regs[rs1] << (regs[rs2] & 31)
+        elif name == 'srl':
+            value = regs[rs1] >> (regs[rs2] & 31)
+        elif name == 'sra':
+            value = ((regs[rs1] ^ 0x80000000) - 0x80000000) >> (regs[rs2] & 31)
+        elif name == 'slli':
+            value = regs[rs1] << imm
+        elif name == 'srli':
+            value = regs[rs1] >> imm
+        elif name == 'srai':
+            value = ((regs[rs1] ^ 0x80000000) - 0x80000000) >> imm
+        elif name == 'slt':
+            value = int((regs[rs1] ^ 0x80000000) < (regs[rs2] ^ 0x80000000))
+        elif name == 'sltu':
+            value = int(regs[rs1] < regs[rs2])
+        elif name == 'lw':
+            addr = (regs[rs1] + imm) & 0xFFFFFFFF
+            if addr % 4 != 0:
+                raise ValueError(f"Unaligned memory access at address {addr}")
+            value = self.memory.get(addr, 0)
+        elif name == 'sw':
+            addr = (regs[rs1] + imm) & 0xFFFFFFFF
+            if addr % 4 != 0:
+                raise ValueError(f"Unaligned memory access at address {addr}")
+            self.memory[addr] = regs[rs2]
+            if self.watch_pages:
+                self.check_watchpoint(addr, next_pc)
+        elif name in ['lb', 'lh', 'lbu', 'lhu']:
+            # Memory holds aligned little-endian words; narrow accesses
+            # pick their bytes out of the containing word
+            addr = (regs[rs1] + imm) & 0xFFFFFFFF
+            width = 8 if name in ['lb', 'lbu'] else 16
+            if addr & (width // 8 - 1):
+                raise ValueError(f"Unaligned memory access at address {addr}")
+            value = (self.memory.get(addr & ~3, 0) >> ((addr & 3) * 8)) & ((1 << width) - 1)
+            if name in ['lb', 'lh']:
+                value = self.signed(value, width)
+        elif name in ['sb', 'sh']:
+            addr = (regs[rs1] + imm) & 0xFFFFFFFF
+            width = 8 if name == 'sb' else 16
+            if addr & (width // 8 - 1):
+                raise ValueError(f"Unaligned memory access at address {addr}")
+            shift = (addr & 3) * 8
+            mask = ((1 << width) - 1) << shift
+            word_addr = addr & ~3
+            self.memory[word_addr] = (self.memory.get(word_addr, 0) & ~mask) | ((regs[rs2] << shift) & mask)
+            if self.watch_pages:
+                self.check_watchpoint(word_addr, next_pc)
+        elif name == 'beq':
+            if regs[rs1] == regs[rs2]:
+                next_pc = imm
+        elif name == 'bne':
+            if regs[rs1] != regs[rs2]:
+                next_pc = imm
+        elif name == 'blt':
+            if (regs[rs1] ^ 0x80000000) < (regs[rs2] ^ 0x80000000):
+                next_pc = imm
+        elif name == 'bge':
+            if (regs[rs1] ^ 0x80000000) >= (regs[rs2] ^ 0x80000000):
+                next_pc = imm
+        elif name == 'bltu':
+            if regs[rs1] < regs[rs2]:
+                next_pc = imm
+        elif name == 'bgeu':
+            if regs[rs1] >= regs[rs2]:
+                next_pc = imm
+        elif name == 'jal':
+            value = next_pc
+            next_pc = imm
+        elif name == 'jalr':
+            value = next_pc
+            next_pc = (regs[rs1] + imm) & 0xFFFFFFFE
+        elif name in ['ecall', 'ebreak']:
+            # There is no environment to trap into, so both end the program
+            self.pc = next_pc
+            self.cycles += 1
+            self.halted = True
+            return False
+
+        if rd:
+            regs[rd] = value & 0xFFFFFFFF
+        self.pc = next_pc
+        self.cycles += 1
+        return True
+
+    def check_watchpoint(self, addr, next_pc):
+        watched = self.watch_pages.get(addr >> self.PAGE_SHIFT)
+        if watched and watched[(addr & ((1 << self.PAGE_SHIFT) - 1)) >> 2]:
+            self.pc = next_pc
+            self.cycles += 1
+            raise WatchpointHit(addr)
+
+    def run(self, max_steps, stop_at=None):
+        # Run-to-cursor is a temporary breakpoint for the length of the run
+        temporary = stop_at is not None and not stop_at & 3 and \
+            0 <= stop_at >> 2 < len(self.imem) and not self.breakpoints[stop_at >> 2]
+        if temporary:
+            self.set_breakpoint(stop_at)
+        start = self.cycles
+        try:
+            with self.profiler.phase("simulate"):
+                return self.run_blocks(max_steps)
+        finally:
+            self.profiler.count("executed", self.cycles - start)
+            if temporary:
+                self.set_breakpoint(stop_at, False)
+
+    def run_blocks(self, max_steps):
+        self.stop_reason = None
+        resume = self.breakpoint_stop
+        self.breakpoint_stop = None
+        step = self.step
+        start = self.cycles
+        limit = start + max_steps
+
+        try:
+            if not self.breakpoint_count:
+                while self.cycles < limit and step():
+                    pass
+            else:
+                # Breakpoints are only looked at when entering a straight-line
+                # block; blocks with no breakpoint inside them run unchecked.
+                breakpoints = self.breakpoints
+                block_len = self.block_lengths()
+                count = len(self.imem)
+                while self.cycles < limit and not self.halted:
+                    pc = self.pc
+                    index = pc >> 2
+                    if not pc & 3 and index < count:
+                        if breakpoints[index] and (pc, self.cycles) != resume:
+                            self.stop_reason = "breakpoint"
+                            self.breakpoint_stop = (pc, self.cycles)
+                            break
+                        length = block_len[index]
+                        if length > 1 and self.cycles + length <= limit and \
+                                breakpoints.find(1, index + 1, index + length) < 0:
+                            for _ in range(length):
+                                step()
+                            continue
+                    if not step():
+                        break
+        except WatchpointHit as hit:
+            self.stop_reason = f"watchpoint [{hit.args[0]}]"
+
+        if self.halted:
+            self.stop_reason = "halted"
+        return self.cycles - start
+
+class BatchSimulator(Simulator):
+    # Runs one program over many input sets in lockstep: registers are a
+    # (lanes, 32) uint32 array and each instruction executes at once for
+    # every lane waiting at its pc. While all live lanes agree on the pc it
+    # is kept as a single number; once a branch splits them, the lowest pc
+    # runs first with the other lanes masked off, which lets structured
+    # code reconverge. Breakpoints and watchpoints are not supported here.
+    HALTED = 1 << 62
+
+    def __init__(self, assembler, words, lanes, entry=0):
+        if np is None:
+            raise ImportError("BatchSimulator needs NumPy (pip install numpy)")
+        self.lanes = lanes
+        super().__init__(assembler, words, entry)
+
+    def reset(self):
+        # Stored register-major so a lane mask picks from one contiguous row
+        self.columns = np.zeros((32, self.lanes), dtype=np.uint32)
+        self.regs = self.columns.T
+        self.memory = {}
+        self.pcs = np.full(self.lanes, self.entry, dtype=np.int64)
+        self.cycles = np.zeros(self.lanes, dtype=np.int64)
+        self.done = np.zeros(self.lanes, dtype=bool)
+        self.live = slice(None)
+        self.live_count = self.lanes
+        self.pc = self.entry
+        self.steps = 0
+        self.halted = False
+        self.stop_reason = None
+
+    def set_register(self, reg, values):
+        index = self.assembler.REGS[reg] if isinstance(reg, str) else reg
+        if index:
+            self.columns[index] = np.asarray(values, dtype=np.int64).astype(np.uint32)
+
+    def set_memory(self, addr, values):
+        if addr % 4 != 0:
+            raise ValueError(f"Unaligned memory access at address {addr}")
+        column = np.zeros(self.lanes, dtype=np.uint32)
+        column[:] = np.asarray(values, dtype=np.int64).astype(np.uint32)
+        self.memory[addr] = column
+
+    def load(self, lanes, addrs, width):
+        if (addrs & (width - 1)).any():
+            raise ValueError(f"Unaligned memory access at address {int(addrs[(addrs & (width - 1)) != 0][0])}")
+        word_addrs = addrs & np.uint32(0xFFFFFFFC)
+        first = int(word_addrs[0])
+        if (word_addrs == first).all():
+            column = self.memory.get(first)
+            words = column[lanes] if column is not None else np.zeros(len(addrs), dtype=np.uint32)
+        else:
+            words = np.zeros(len(addrs), dtype=np.uint32)
+            for word_addr in np.unique(word_addrs):
+                column = self.memory.get(int(word_addr))
+                if column is not None:
+                    selected = word_addrs == word_addr
+                    words[selected] = column[lanes][selected]
+        if width == 4:
+            return words
+        return (words >> ((addrs & 3) * 8)) & np.uint32((1 << (width * 8)) - 1)
+
+    def store(self, lanes, addrs, values, width):
+        if (addrs & (width - 1)).any():
+            raise ValueError(f"Unaligned memory access at address {int(addrs[(addrs & (width - 1)) != 0][0])}")
+        word_addrs = addrs & np.uint32(0xFFFFFFFC)
+        first = int(word_addrs[0])
+        if (word_addrs == first).all():
+            groups = [(first, lanes, slice(None))]
+        else:
+            lane_ids = np.arange(self.lanes)[lanes]
+            groups = []
+            for word_addr in np.unique(word_addrs):
+                selected = word_addrs == word_addr
+                groups.append((int(word_addr), lane_ids[selected], selected))
+        for word_addr, ids, selected in groups:
+            column = self.memory.setdefault(word_addr, np.zeros(self.lanes, dtype=np.uint32))
+            if width == 4:
+                column[ids] = values[selected]
+            else:
+                shift = (addrs[selected] & 3) * 8
+                mask = np.uint32((1 << (width * 8)) - 1) << shift
+                column[ids] = (column[ids] & ~mask) | ((values[selected] << shift) & mask)
+
+    def step(self):
+        if self.pc is None:
+            pc = int(self.pcs.min())
+            if pc == self.HALTED:
+                self.halted = True
+                return False
+            lanes = self.pcs == pc
+            if np.count_nonzero(lanes) == self.live_count:
+                self.pc, lanes = pc, self.live
+        else:
+            pc, lanes = self.pc, self.live
+
+        index = pc >> 2
+        if pc & 3 or index >= len(self.imem):
+            self.finish(lanes)
+            return not self.halted
+
+        inst = self.decoded[index]
+        if inst is None:
+            inst = self.decoded[index] = self.decode(pc, self.imem[index])
+            self.profiler.count("decoded")
+
+        name, rd, rs1, rs2, imm = inst
+        regs = self.columns
+        a = regs[rs1][lanes]
+        uimm = np.uint32(imm & 0xFFFFFFFF)
+        next_pc = pc + 4
+        value = None
+        halt = False
+
+        if name == 'addi':
+            value = a + uimm
+        elif name == 'add':
+            value = a + regs[rs2][lanes]
+        elif name == 'sub':
+            value = a - regs[rs2][lanes]
+        elif name == 'mul':
+            value = a * regs[rs2][lanes]
+        elif name == 'and':
+            value = a & regs[rs2][lanes]
+        elif name == 'or':
+            value = a | regs[rs2][lanes]
+        elif name == 'xor':
+            value = a ^ regs[rs2][lanes]
+        elif name == 'ori':
+            value = a | uimm
+        elif name == 'xori':
+            value = a ^ uimm
+        elif name == 'andi':
+            value = a & uimm
+        elif name == 'slti':
+            value = (a.astype(np.int32) < imm).astype(np.uint32)
+        elif name == 'sltiu':
+            value = (a < uimm).astype(np.uint32)
+        elif name == 'lui':
+            value = uimm
+        elif name == 'sll':
+            value = a << (regs[rs2][lanes] & 31)
+        elif name == 'srl':
+            value = a >> (regs[rs2][lanes] & 31)
+        elif name == 'sra':
+            value = (a.astype(np.int32) >> (regs[rs2][lanes] & 31).astype(np.int32)).astype(np.uint32)
+        elif name == 'slli':
+            value = a << uimm
+        elif name == 'srli':
+            value = a >> uimm
+        elif name == 'srai':
+            value = (a.astype(np.int32) >> imm).astype(np.uint32)
+        elif name == 'slt':
+            value = (a.astype(np.int32) < regs[rs2][lanes].astype(np.int32)).astype(np.uint32)
+        elif name == 'sltu':
+            value = (a < regs[rs2][lanes]).astype(np.uint32)
+        elif name in ['lw', 'lb', 'lh', 'lbu', 'lhu']:
+            width = {'lw': 4, 'lb': 1, 'lbu': 1}.get(name, 2)
+            value = self.load(lanes, a + uimm, width)
+            if name == 'lb':
+                value = value.astype(np.int8).astype(np.uint32)
+            elif name == 'lh':
+                value = value.astype(np.int16).astype(np.uint32)
+        elif name in ['sw', 'sb', 'sh']:
+            self.store(lanes, a + uimm, regs[rs2][lanes], {'sw': 4, 'sb': 1}.get(name, 2))
+        elif name in ['beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu']:
+            b = regs[rs2][lanes]
+            if name == 'beq':
+                taken = a == b
+            elif name == 'bne':
+                taken = a != b
+            elif name == 'blt':
+                taken = a.astype(np.int32) < b.astype(np.int32)
+            elif name == 'bge':
+                taken = a.astype(np.int32) >= b.astype(np.int32)
+            elif name == 'bltu':
+                taken = a < b
+            else:
+                taken = a >= b
+            next_pc = self.branch(lanes, taken, imm, next_pc)
+        elif name == 'jal':
+            value = np.uint32(next_pc)
+            next_pc = imm
+        elif name == 'jalr':
+            value = np.uint32(next_pc)
+            targets = (a + uimm).astype(np.int64) & ~1
+            next_pc = int(targets[0]) if (targets == targets[0]).all() else targets
+        elif name in ['ecall', 'ebreak']:
+            halt = True
+
+        if rd and value is not None:
+            regs[rd][lanes] = value
+        if isinstance(lanes, slice):
+            self.cycles += 1
+        else:
+            self.cycles += lanes
+        self.steps += 1
+        if halt:
+            self.finish(lanes)
+            return not self.halted
+        if self.pc is not None and isinstance(next_pc, int):
+            self.pc = next_pc
+        else:
+            if self.pc is not None:
+                self.pc = None
+            self.pcs[lanes] = next_pc
+        return True
+
+    def branch(self, lanes, taken, target, next_pc):
+        # A single pc when every lane agrees, otherwise one per lane
+        if taken.all():
+            return target
+        if not taken.any():
+            return next_pc
+        return np.where(taken, target, next_pc)
+
+    def finish(self, lanes):
+        self.done[lanes] = True
+        self.pcs[lanes] = self.HALTED
+        self.live = ~self.done
+        self.live_count = self.lanes - int(np.count_nonzero(self.done))
+        self.pc = None
+        if not self.live_count:
+            self.halted = True
+
+    def run(self, max_steps, stop_at=None):
+        start = self.steps
+        self.stop_reason = None
+        with self.profiler.phase("simulate"):
+            while self.steps - start < max_steps and self.step():
+                pass
+        self.profiler.count("lockstep steps", self.steps - start)
+        if self.halted:
+            self.stop_reason = "halted"
+        return self.steps - start
+
+class CycleEstimator:
+    # Static best/worst-case cycle counts for the single-cycle datapath,
+    # where every instruction takes CYCLES.get(name, 1) cycles. Loops are
+    # natural loops found from DFS back edges and are collapsed innermost
+    # first into single nodes, so each function ends up as a DAG scored in
+    # one topological pass. Loop bounds come from "# bound: N" (or
+    # "# bound: MIN..MAX") comments on the loop's first or branching line;
+    # a bound counts how many times the loop header runs per entry.
+    CYCLES = {}
+    BRANCHES = ['beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu']
+    END = -1
+
+    def __init__(self, assembler, words, source_map=None, asm=None, labels=None):
+        self.assembler = assembler
+        self.words = words
+        self.names = {}
+        for label, pc in (labels or {}).items():
+            self.names.setdefault(pc, label)
+        self.bounds = self.loop_bounds(source_map or {}, asm or [])
+        self.build_blocks()
+        self.results = {}
+
+    def loop_bounds(self, source_map, asm):
+        line_pcs = {}
+        for pc in sorted(source_map):
+            line_pcs.setdefault(source_map[pc], []).append(pc)
+        ordered = sorted(line_pcs)
+
+        bounds = {}
+        for line_num, line in enumerate(asm):
+            if '#' not in line:
+                continue
+            m = re.search(r'#\s*bound\s*[:=]?\s*(\d+)(?:\s*\.\.\s*(\d+))?', line, re.IGNORECASE)
+            if not m:
+                continue
+            low, high = (int(m.group(1)), int(m.group(2))) if m.group(2) else (1, int(m.group(1)))
+            # A comment on a label-only line belongs to the next instruction
+            position = bisect.bisect_left(ordered, line_num)
+            if position < len(ordered):
+                for pc in line_pcs[ordered[position]]:
+                    bounds[pc] = (max(low, 1), max(high, low, 1))
+        return bounds
+
+    def build_blocks(self):
+        sim = Simulator(self.assembler, self.words)
+        count = len(self.words)
+        insts = []
+        leaders = bytearray(count + 1)
+        leaders[0] = 1
+
+        for index, word in enumerate(self.words):
+            try:
+                inst = sim.decode(index * 4, word)
+            except ValueError:
+                inst = None
+            insts.append(inst)
+            name = inst[0] if inst else None
+            if name in self.BRANCHES or name == 'jal':
+                target = inst[4]
+                if not target & 3 and target >> 2 < count:
+                    leaders[target >> 2] = 1
+                leaders[index + 1] = 1
+            elif name in [None, 'jalr', 'ecall', 'ebreak']:
+                leaders[index + 1] = 1
+
+        # Blocks are keyed by the index of their first word; END stands for
+        # every way of leaving the function (return, halt, trap)
+        self.blocks = {}
+        starts = [i for i in range(count) if leaders[i]]
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else count
+            last = insts[end - 1]
+            cost = sum(self.CYCLES.get(inst[0], 1) if inst else 1 for inst in insts[start:end])
+            fall = end if end < count else self.END
+            callee = None
+            name = last[0] if last else None
+            if name in self.BRANCHES:
+                succs = [fall, self.target_block(last[4])]
+            elif name == 'jal' and last[1] == 0:
+                succs = [self.target_block(last[4])]
+            elif name == 'jal':
+                callee = self.target_block(last[4])
+                succs = [fall if callee != self.END else self.END]
+            elif name in [None, 'jalr', 'ecall', 'ebreak']:
+                succs = [self.END]
+            else:
+                succs = [fall]
+            self.blocks[start] = (end, cost, list(dict.fromkeys(succs)), callee)
+
+    def target_block(self, target):
+        if target & 3 or target >> 2 >= len(self.words):
+            return self.END
+        return target >> 2
+
+    def estimate(self):
+        entries = [0] if self.words else []
+        entries += sorted({callee for end, cost, succs, callee in self.blocks.values()
+                           if callee not in (None, self.END, 0)})
+        return [self.function(entry) for entry in entries]
+
+    def function(self, entry, active=None):
+        if entry in self.results:
+            return self.results[entry]
+        active = active or set()
+        name = self.names.get(entry * 4, f"func_{entry * 4:x}")
+        if entry in active:
+            return CycleEstimate(name, entry * 4, float('inf'), float('inf'), [], ["recursive call"])
+        active.add(entry)
+
+        notes = []
+        best, worst, succ = {self.END: 0}, {self.END: 0}, {self.END: []}
+        order, back_edges = self.reachable(entry)
+        for node in order:
+            end, cost, succs, callee = self.blocks[node]
+            best[node] = worst[node] = cost
+            if callee is not None:
+                called = self.function(callee, active)
+                best[node] += called.best
+                worst[node] += called.worst
+                if called.worst == float('inf'):
+                    notes.append(f"call at 0x{(end - 1) * 4:08x} to {called.name} is unbounded")
+            succ[node] = succs
+        active.discard(entry)
+
+        preds = {}
+        for node in order:
+            for s in succ[node]:
+                preds.setdefault(s, []).append(node)
+
+        latches = {}
+        for u, h in back_edges:
+            latches.setdefault(h, []).append(u)
+        loops = []
+        for h, tails in latches.items():
+            body = {h}
+            stack = [u for u in tails if u != h]
+            body.update(stack)
+            while stack:
+                for p in preds.get(stack.pop(), []):
+                    if p not in body:
+                        body.add(p)
+                        stack.append(p)
+            loops.append((len(body), h, tails, body))
+        loops.sort(key=lambda loop: loop[0])
+
+        rep = {node: node for node in order}
+        rep[self.END] = self.END
+        loop_report = []
+        for size, h, tails, body in loops:
+            members = {rep[n] for n in body}
+            bound = None
+            for node in [h] + tails:
+                for index in range(node, self.blocks[node][0]):
+                    bound = bound or self.bounds.get(index * 4)
+            loop_report.append((h * 4, bound))
+
+            paths = self.paths(h, members, rep, best, worst, succ, skip=h)
+            if paths is None:
+                notes.append(f"irreducible control flow at 0x{h * 4:08x}")
+                best[h] = worst[h] = float('inf')
+                exits = set()
+            else:
+                low_dist, high_dist = paths
+                latch_nodes = [m for m in low_dist if any(rep[s] == h for s in succ[m])]
+                exit_nodes = [m for m in low_dist if any(rep[s] not in members for s in succ[m])]
+                exits = {rep[s] for m in exit_nodes for s in succ[m] if rep[s] not in members}
+                if not exit_nodes:
+                    notes.append(f"loop at 0x{h * 4:08x} never exits")
+                    best[h] = worst[h] = float('inf')
+                else:
+                    low, high = bound or (1, None)
+                    best[h] = min(low_dist[m] for m in exit_nodes)
+                    if low > 1:
+                        best[h] += (low - 1) * min(low_dist[m] for m in latch_nodes)
+                    worst[h] = max(high_dist[m] for m in exit_nodes)
+                    if high is None:
+                        notes.append(f"loop at 0x{h * 4:08x} has no bound annotation")
+                        worst[h] = float('inf')
+                    elif high > 1:
+                        worst[h] += (high - 1) * max(high_dist[m] for m in latch_nodes)
+            succ[h] = list(exits)
+            for n in body:
+                rep[n] = h
+
+        paths = self.paths(rep[entry], None, rep, best, worst, succ)
+        if paths is None:
+            notes.append("irreducible control flow")
+            low = high = float('inf')
+        else:
+            low, high = paths[0].get(self.END, float('inf')), paths[1].get(self.END, float('inf'))
+        result = CycleEstimate(name, entry * 4, low, high, loop_report, notes)
+        self.results[entry] = result
+        return result
+
+    def reachable(self, entry):
+        # Iterative DFS; an edge to a block still on the stack is a back edge
+        order, back_edges = [], []
+        state = {entry: 1}
+        stack = [(entry, iter(self.blocks[entry][2]))]
+        order.append(entry)
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child == self.END:
+                    continue
+                if child not in state:
+                    state[child] = 1
+                    order.append(child)
+                    stack.append((child, iter(self.blocks[child][2])))
+                    break
+                if state[child] == 1:
+                    back_edges.append((node, child))
+            else:
+                state[node] = 2
+                stack.pop()
+        return order, back_edges
+
+    def paths(self, start, members, rep, best, worst, succ, skip=None):
+        # Shortest and longest node-weighted paths from start over the
+        # collapsed graph (restricted to members when given, ignoring edges
+        # back to skip); None if what is left still has a cycle
+        topo, state = [], {start: 1}
+        stack = [(start, iter(succ[start]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                child = rep[child]
+                if child == skip or (members is not None and child not in members):
+                    continue
+                if child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(succ[child])))
+                    break
+                if state[child] == 1:
+                    return None
+            else:
+                state[node] = 2
+                topo.append(node)
+                stack.pop()
+
+        low_dist, high_dist = {start: best[start]}, {start: worst[start]}
+        for node in reversed(topo):
+            for child in set(rep[s] for s in succ[node]):
+                if child == skip or (members is not None and child not in members):
+                    continue
+                low = low_dist[node] + best[child]
+                high = high_dist[node] + worst[child]
+                if child not in low_dist or low < low_dist[child]:
+                    low_dist[child] = low
+                if child not in high_dist or high > high_dist[child]:
+                    high_dist[child] = high
+        return low_dist, high_dist
+
+class ProgramGenerator:
+    # Seeded random programs built from the OPCODES tables. They always
+    # terminate: the only backward branches close counted loops whose
+    # counters nothing else writes, every other branch jumps forward, and
+    # functions are leaves. Code comes in sections that jump over their own
+    # functions, so every call and jump stays in range at any program size.
+    SECTION_SIZE = 2000
+    DATA_BASE = 0x10000
+    DATA_BYTES = 2048
+    MAX_TRIPS = 4
+
+    def __init__(self, architecture, seed=0):
+        self.architecture = architecture
+        self.random = random.Random(seed)
+        self.label_count = 0
+        assembler = Assembler(architecture)
+        regs = assembler.REV_REGS
+
+        if architecture == "RISC-V":
+            reserved = [0, 1, 2, 3, 4, 5]
+            self.counters = [regs[4], regs[5]]
+            self.base, self.ra = regs[3], regs[1]
+        else:
+            reserved = [0, 1, 22, 23, 26, 27, 28, 29, 30, 31]
+            self.counters = [regs[22], regs[23]]
+            self.base, self.ra = regs[28], regs[31]
+        self.zero = regs[0]
+        self.scratch = [regs[i] for i in range(32) if i not in reserved]
+        self.sources = self.scratch + [self.zero, self.base]
+
+        # Instruction classes come straight from the encoding tables, so new
+        # table entries are generated without touching this class
+        self.alu_reg, self.shifts, self.alu_imm, self.upper = [], [], [], []
+        self.loads, self.stores, self.branches = [], [], []
+        self.widths = {}
+        for name, instr in assembler.OPCODES.items():
+            if architecture == "RISC-V":
+                if instr.fmt == 'R':
+                    self.alu_reg.append(name)
+                elif instr.fmt == 'I' and instr.opcode == 0x13:
+                    self.alu_imm.append(name)
+                elif instr.fmt == 'IS':
+                    self.shifts.append(name)
+                elif instr.fmt == 'U':
+                    self.upper.append(name)
+                elif instr.fmt == 'L' and instr.opcode == 0x03:
+                    self.loads.append(name)
+                    self.widths[name] = 1 << (instr.funct3 & 3)
+                elif instr.fmt == 'S':
+                    self.stores.append(name)
+                    self.widths[name] = 1 << (instr.funct3 & 3)
+                elif instr.fmt == 'SB':
+                    self.branches.append(name)
+            elif instr.fmt == 'R' and name != 'jr':
+                (self.shifts if instr.funct < 0x08 else self.alu_reg).append(name)
+            elif instr.fmt == 'I':
+                if 0x04 <= instr.opcode <= 0x07:
+                    self.branches.append(name)
+                elif 0x08 <= instr.opcode <= 0x0E:
+                    self.alu_imm.append(name)
+                elif instr.opcode == 0x0F:
+                    self.upper.append(name)
+                elif 0x20 <= instr.opcode <= 0x27:
+                    self.loads.append(name)
+                    self.widths[name] = {0: 1, 1: 2}.get(instr.opcode & 3, 4)
+                elif 0x28 <= instr.opcode <= 0x2F:
+                    self.stores.append(name)
+                    self.widths[name] = {0: 1, 1: 2}.get(instr.opcode & 3, 4)
+
+    def new_label(self, prefix):
+        self.label_count += 1
+        return f"{prefix}{self.label_count}"
+
+    def immediate(self, name):
+        if self.architecture == "RISC-V":
+            return self.random.randint(-2048, 2047)
+        if name in ['ori', 'andi', 'xori']:
+            return self.random.randint(0, 0xFFFF)
+        return self.random.randint(-32768, 32767)
+
+    def alu_op(self):
+        r = self.random
+        rd = r.choice(self.scratch)
+        rs = r.choice(self.sources)
+        roll = r.random()
+        if roll < 0.45:
+            return f"{r.choice(self.alu_reg)} {rd}, {rs}, {r.choice(self.sources)}"
+        elif roll < 0.85:
+            name = r.choice(self.alu_imm)
+            return f"{name} {rd}, {rs}, {self.immediate(name)}"
+        elif roll < 0.95:
+            return f"{r.choice(self.shifts)} {rd}, {rs}, {r.randrange(32)}"
+        bits = 20 if self.architecture == "RISC-V" else 16
+        return f"{r.choice(self.upper)} {rd}, 0x{r.getrandbits(bits):x}"
+
+    def memory_op(self):
+        r = self.random
+        if r.random() < 0.6:
+            name, reg = r.choice(self.loads), r.choice(self.scratch)
+        else:
+            name, reg = r.choice(self.stores), r.choice(self.sources)
+        offset = r.randrange(0, self.DATA_BYTES, self.widths[name])
+        return f"{name} {reg}, {offset}({self.base})"
+
+    def call(self, function):
+        if self.architecture == "RISC-V":
+            return f"jal {self.ra}, {function}"
+        return f"jal {function}"
+
+    def jump(self, label):
+        if self.architecture == "RISC-V":
+            return f"jal {self.zero}, {label}"
+        return f"j {label}"
+
+    def ret(self):
+        if self.architecture == "RISC-V":
+            return f"jalr {self.zero}, 0({self.ra})"
+        return f"jr {self.ra}"
+
+    def block(self, lines, size, depth, functions):
+        # Appends about size instructions and returns how many it appended
+        r = self.random
+        emitted = 0
+        while emitted < size:
+            roll = r.random()
+            room = size - emitted
+            if roll < 0.08 and room > 2:
+                label = self.new_label("skip")
+                lines.append(f"{r.choice(self.branches)} {r.choice(self.sources)}, {r.choice(self.sources)}, {label}")
+                emitted += 1 + self.block(lines, min(r.randint(1, 8), room - 1), depth, functions)
+                lines.append(f"{label}:")
+            elif roll < 0.12 and room > 6 and depth < len(self.counters):
+                counter, label = self.counters[depth], self.new_label("loop")
+                trips = r.randint(1, self.MAX_TRIPS)
+                lines.append(f"addi {counter}, {self.zero}, {trips}")
+                lines.append(f"{label}:")
+                emitted += 1 + self.block(lines, min(r.randint(3, 32), room - 3), depth + 1, functions)
+                lines.append(f"addi {counter}, {counter}, -1")
+                lines.append(f"bne {counter}, {self.zero}, {label} # bound: {trips}..{trips}")
+                emitted += 2
+            elif roll < 0.16 and functions:
+                lines.append(self.call(r.choice(functions)))
+                emitted += 1
+            elif roll < 0.45:
+                lines.append(self.memory_op())
+                emitted += 1
+            else:
+                lines.append(self.alu_op())
+                emitted += 1
+        return emitted
+
+    def generate(self, count):
+        r = self.random
+        lines = [f"li {self.base}, {self.DATA_BASE}"]
+        emitted = 1
+        while emitted < count:
+            functions = [self.new_label("func") for _ in range(r.randint(1, 4))]
+            end = self.new_label("section")
+            emitted += self.block(lines, min(self.SECTION_SIZE, count - emitted), 0, functions)
+            lines.append(self.jump(end))
+            emitted += 1
+            for function in functions:
+                lines.append(f"{function}:")
+                emitted += self.block(lines, r.randint(2, 24), len(self.counters), [])
+                lines.append(self.ret())
+                emitted += 1
+            lines.append(f"{end}:")
+        return lines
+
+class AssemblerService:
+    MAX_SIM_STEPS = 10000000
+
+    def __init__(self, cache_dir=None, use_cache=True):
+        self.cache = BuildCache(cache_dir) if use_cache else None
+        # Built once per worker and reused by every request it serves
+        self.assemblers = {arch: Assembler(arch, self.cache) for arch in ["RISC-V", "MIPS"]}
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+
+        assembler = self.assemblers.get(request.get("arch", "RISC-V"))
+        if assembler is None:
+            raise ValueError(f'Unknown architecture "{request.get("arch")}"')
+
+        if op == "assemble":
+            program = assembler.assemble_program(request["source"].splitlines(), request.get("optimize", False))
+            return {"ok": not program.errors, "words": program.words, "source_map": program.source_map,
+                    "labels": program.labels, "errors": program.errors, "removed": program.removed}
+
+        elif op == "disassemble":
+            base = 0
+            if "image" in request:
+                image = load_image(request["image"])
+                words, base = list(image.words), image.base
+                close_image(image)
+            else:
+                words = request["words"]
+            return {"ok": True, "lines": [assembler.disassemble_instruction(word) for word in words],
+                    "source": assembler.disassemble_program(words, base)}
+
+        elif op == "simulate":
+            entry = 0
+            if "image" in request:
+                image = load_image(request["image"])
+                words, entry = list(image.words), image.entry
+                close_image(image)
+                if image.base != 0:
+                    raise ValueError("The simulator maps instruction memory at address 0")
+            elif "words" in request:
+                words = request["words"]
+            else:
+                program = assembler.assemble_program(request["source"].splitlines(), request.get("optimize", False))
+                if program.errors:
+                    return {"ok": False, "errors": program.errors}
+                words = program.words
+            sim = Simulator(assembler, words, entry)
+            try:
+                sim.run(min(request.get("max_steps", 100000), self.MAX_SIM_STEPS))
+            except ValueError as e:
+                return {"ok": False, "error": str(e), "pc": sim.pc, "cycles": sim.cycles, "regs": sim.regs}
+            return {"ok": True, "pc": sim.pc, "cycles": sim.cycles, "halted": sim.halted,
+                    "regs": sim.regs, "memory": sim.memory}
+
+        raise ValueError(f'Unknown operation "{op}"')
+
+class ServiceClient:
+    def __init__(self, socket_path=None, port=None, timeout=None):
+        if socket_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection(("127.0.0.1", port), timeout)
+        self.next_id = 0
+
+    def call(self, op, **fields):
+        self.next_id += 1
+        request = dict(fields, op=op, id=self.next_id)
+        self.sock.sendall(encode_frame(request))
+        length = int.from_bytes(self.recv_exact(4), "big")
+        return json.loads(self.recv_exact(length))
+
+    def recv_exact(self, count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("Service closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def close(self):
+        self.sock.close()
+
+class AssemblerApp(Assembler):
+    # Run the simulator in slices of this many seconds between Tk events and
+    # redraw the register view at most once per DEBUG_REFRESH seconds.
+    DEBUG_SLICE = 0.02
+    DEBUG_REFRESH = 0.1
+    DEBUG_BATCH = 2000
+    # assemble_all runs the program in the debugger for at most this many cycles
+    ASSEMBLE_RUN_LIMIT = 100000
+
+    def __init__(self, root, architecture):
+        super().__init__(architecture)
+        self.root = root
+        self.root.title(f"{architecture} Mini Assembler")
+
+        # Define colors for the main application
+        self.background_color = "#E0F2F7"  # Light blue/off-white
+        self.header_color = "#34495E" # Darker blue for headers/labels
+        self.text_area_bg = "#FFFFFF" # White for text boxes
+        self.text_area_fg = "#2C3E50" # Dark blue/navy for text
+        self.button_bg_color = "#3498DB"  # Medium blue
+        self.button_fg_color = "#FFFFFF"  # White
+
+        self.root.configure(bg=self.background_color)
+
+        self.create_widgets()
+        self.create_menu()
+
+        self.assembled = []
+        self.hex_map = {}
+
+        self.program = None
+        self.simulator = None
+        self.line_to_pc = {}
+        self.debug_running = False
+        self.debug_after_id = None
+        self.debug_stop_at = None
+        self.debug_limit = None
+        self.debug_note = ""
+        self.last_debug_refresh = 0.0
+        self.breakpoint_lines = set()
+        self.watch_addrs = set()
+
+        self.documentation_url = "https://riscv.org/about/" if architecture == "RISC-V" else "https://www.mips.com/"
+
+    def create_widgets(self):
+        self.font_family = "Berlin Sans FB Demi"
+        self.font_size = 12
+        self.font = (self.font_family, self.font_size)
+
+        style = ttk.Style()
+        style.theme_use('clam')
+        style.configure('TFrame', background=self.background_color)
+        style.configure('TLabel', background=self.background_color, foreground=self.header_color, font=self.font)
+        style.configure('TButton', font=(self.font_family, 10), background=self.button_bg_color, foreground=self.button_fg_color, relief="flat")
+        style.map('TButton',
+                  background=[('active', '#21618C')],
+                  foreground=[('active', self.button_fg_color)])
+
+        # Style for Text widgets
+        self.root.option_add('*Text*Background', self.text_area_bg)
+        self.root.option_add('*Text*Foreground', self.text_area_fg)
+        self.root.option_add('*Text*Font', self.font)
+        self.root.option_add('*Text*Borderwidth', 1)
+        self.root.option_add('*Text*Relief', 'solid')
+        self.root.option_add('*Text*BorderColor', '#BDC3C7') # Light gray border
+
+        self.frame = ttk.Frame(self.root, padding=10)
+        self.frame.pack(fill="both", expand=True)
+
+        ttk.Label(self.frame, text="Instructions").pack(anchor="w")
+        self.input_box = tk.Text(self.frame, height=8, width=70)
+        self.input_box.pack(fill="x", pady=(0, 10))
+
+        output_frame = ttk.Frame(self.frame)
+        output_frame.pack(fill="both", expand=True)
+
+        left_frame = ttk.Frame(output_frame)
+        left_frame.pack(side="left", fill="both", expand=True, padx=(0,5))
+
+        ttk.Label(left_frame, text="Assembled Output").pack(anchor="w")
+        self.output_box = tk.Text(left_frame, height=15, width=40)
+        self.output_box.pack(fill="both", expand=True)
+
+        right_frame = ttk.Frame(output_frame)
+        right_frame.pack(side="left", fill="both", expand=True, padx=(5,0))
+
+        ttk.Label(right_frame, text="Register Values (Terminal)").pack(anchor="w")
+        self.terminal_box = tk.Text(right_frame, height=15, width=30)
+        self.terminal_box.pack(fill="both", expand=True)
+
+        debug_frame = ttk.Frame(self.frame)
+        debug_frame.pack(fill="x", pady=(10, 0))
+
+        ttk.Label(debug_frame, text="Debugger").pack(side="left", padx=(0, 10))
+        ttk.Button(debug_frame, text="Reset", command=self.debug_reset).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Run", command=self.debug_run).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Pause", command=self.debug_pause).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Step", command=self.debug_step).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Run to Cursor", command=self.debug_run_to_cursor).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Breakpoint", command=self.toggle_breakpoint).pack(side="left", padx=(0, 5))
+        ttk.Button(debug_frame, text="Watch", command=self.toggle_watchpoint).pack(side="left", padx=(0, 5))
+        self.input_box.tag_configure('debug_bp', background="#F5B7B1")
+        self.input_box.tag_configure('debug_pc', background="#F9E79F")
+
+        bottom_frame = ttk.Frame(self.frame)
+        bottom_frame.pack(fill="x", pady=10)
+
+        style.configure('Back.TButton', font=(self.font_family, 10),
+                        background="#E74C3C", foreground=self.button_fg_color, relief="flat") # A red for 'Back'
+        style.map('Back.TButton',
+                  background=[('active', '#C0392B')])
+
+        self.back_btn = ttk.Button(bottom_frame, text="← Back",
+                                    style='Back.TButton', command=self.return_to_selection)
+        self.back_btn.pack(side="left", padx=(0, 5))
+
+        # Styling for OptionMenu
+        style.configure('TMenubutton', font=(self.font_family, 10), background=self.button_bg_color, foreground=self.button_fg_color, relief="flat")
+        style.map('TMenubutton',
+                  background=[('active', '#21618C')],
+                  foreground=[('active', self.button_fg_color)])
+
+        self.selected_var = tk.StringVar(value="Select instruction")
+        self.copy_menu = ttk.OptionMenu(bottom_frame, self.selected_var, "Select instruction")
+        self.copy_menu.pack(side="left", padx=(0, 5))
+
+        copy_btn = ttk.Button(bottom_frame, text="Copy Hex", command=self.copy_selected)
+        copy_btn.pack(side="left", padx=(0, 5))
+
+        self.assemble_btn = ttk.Button(bottom_frame, text="Assemble", command=self.assemble_all)
+        self.assemble_btn.pack(side="right")
+
+        self.optimize_var = tk.BooleanVar(value=False)
+        optimize_check = ttk.Checkbutton(bottom_frame, text="Optimize", variable=self.optimize_var)
+        optimize_check.pack(side="right", padx=(0, 5))
+
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Label(self.frame, textvariable=self.status_var, font=(self.font_family, 9)).pack(anchor="w")
+
+    def create_menu(self):
+        self.menubar = tk.Menu(self.root, bg=self.button_bg_color, fg=self.button_fg_color)
+        self.root.config(menu=self.menubar)
+
+        # Style for Menu items
+        menu_font = (self.font_family, 10)
+        file_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
+        file_menu.add_command(label="Open Hex File", command=self.open_hex_file)
+        file_menu.add_command(label="Open Image File", command=self.open_image_file)
+        file_menu.add_command(label="Documentation", command=self.show_docs)
+        file_menu.add_command(label="Save Hex", command=self.save_hex_file)
+        file_menu.add_command(label="Save Image", command=self.save_image_file)
+        file_menu.add_command(label="Clear All", command=self.clear_all)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_exit)
+        self.menubar.add_cascade(label="File", menu=file_menu)
+
+        examples_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
+        for example_name in self.EXAMPLES:
+            examples_menu.add_command(
+                label=example_name,
+                command=lambda name=example_name: self.load_example(name)
+            )
+        self.menubar.add_cascade(label="Examples", menu=examples_menu)
+
+        help_menu = tk.Menu(self.menubar, tearoff=0, bg=self.background_color, fg=self.header_color, font=menu_font)
+        help_menu.add_command(label="Online Help", command=lambda: webbrowser.open("https://t.me/NimaGhafari007"))
+        help_menu.add_command(label="Document", command=self.show_document)
+        help_menu.add_separator()
+        self.deep_profile_var = tk.BooleanVar(value=False)
+        help_menu.add_checkbutton(label="Profile CPU and Memory", variable=self.deep_profile_var)
+        help_menu.add_command(label="Profile Report", command=self.show_profile)
+        self.menubar.add_cascade(label="Help", menu=help_menu)
+
+    def show_document(self):
+        messagebox.showinfo("Document", f"Opening documentation for {self.architecture} architecture.")
+        webbrowser.open(self.documentation_url)
+
+    def show_profile(self):
+        window = tk.Toplevel(self.root)
+        window.title("Profile Report")
+        text = tk.Text(window, width=110, height=35, wrap="none", font=("Courier", 10))
+        text.pack(fill="both", expand=True)
+        text.insert(tk.END, self.profiler.summary())
+        text.config(state="disabled")
+
+    def open_hex_file(self):
+        file_path = filedialog.askopenfilename(
+              defaultextension=".hex",
+            filetypes=[("Hex Files", "*.hex"), ("All Files", "*.*")],
+            title="Open Hex File"
+        )
+
+        if file_path:
+            try:
+                words = read_hex(file_path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to open file: {e}")
+                return
+
+            self.clear_all()
+            self.show_disassembly(words)
+            messagebox.showinfo("Success", "Hex file loaded and disassembled.")
+
+    def open_image_file(self):
+        file_path = filedialog.askopenfilename(
+            defaultextension=".img",
+            filetypes=[("Program Images", "*.img"), ("All Files", "*.*")],
+            title="Open Image File"
+        )
+
+        if file_path:
+            try:
+                image = load_image(file_path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to open file: {e}")
+                return
+            if image.architecture != self.architecture:
+                messagebox.showerror("Error", f"Image is for {image.architecture}, not {self.architecture}")
+                return
+
+            self.clear_all()
+            self.show_disassembly(image.words, image.base)
+            self.terminal_box.insert(tk.END, f'{len(image.words)} words, base 0x{image.base:08x}, '
+                                             f'entry 0x{image.entry:08x}\n')
+            close_image(image)
+
+    def show_disassembly(self, words, base=0):
+        # The recovered source goes in the input box so it can be assembled
+        # again; the output box lists every word with its instruction
+        source = self.disassemble_program(words, base)
+        instructions = [line.strip() for line in source if not line.endswith(':')]
+        self.input_box.insert(tk.END, "\n".join(source))
+        self.output_box.insert(tk.END, "\n".join(
+            f'0x{base + index * 4:08x}: 0x{word:08X} => {instructions[index]}'
+            for index, word in enumerate(words)))
+
+    def save_image_file(self):
+        asm = self.input_box.get("1.0", tk.END).strip().splitlines()
+        program = self.assemble_program(asm, self.optimize_var.get())
+        if not self.assembled or program.errors:
+            messagebox.showwarning("Warning", "No assembled code to save")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".img",
+            filetypes=[("Program Images", "*.img"), ("All Files", "*.*")],
+            title="Save Image File"
+        )
+
+        if file_path:
+            try:
+                write_image(file_path, self.architecture, program.words, source_map=program.source_map)
+                messagebox.showinfo("Success", "Image file saved successfully")
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save file: {e}")
+
+    def return_to_selection(self):
+        if messagebox.askyesno("Confirmation", "Return to architecture selection? Current work will be lost."):
+            self.root.destroy()
+            show_arch_selection()
+
+    def show_docs(self):
+        if self.architecture == "RISC-V":
+            webbrowser.open("https://riscv.org/about/")
+        else:
+            webbrowser.open("https://www.mips.com/")
+
+    def save_hex_file(self):
+        if not self.assembled:
+            messagebox.showwarning("Warning", "No assembled code to save")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+              defaultextension=".hex",
+            filetypes=[("Hex Files", "*.hex"), ("All Files", "*.*")],
+            title="Save Hex File"
+        )
+
+        if file_path:
+            try:
+                with open(file_path, 'w') as f:
+                    for line in self.assembled:
+                        if '=>' in line:
+                            hex_part = line.split('=>')[1].strip()
+                            for hex_to_write in hex_part.split(';'):
+                                hex_to_write = hex_to_write.strip()
+                                if hex_to_write.startswith('0x'):
+                                    f.write(hex_to_write[2:] + '\n')
+                messagebox.showinfo("Success", "Hex file saved successfully")
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save file: {e}")
+
     def clear_all(self):
+        self.debug_pause()
+        self.program = None
+        self.simulator = None
+        self.breakpoint_lines = set()
+        self.watch_addrs = set()
         self.input_box.delete("1.0", tk.END)
         self.output_box.delete("1.0", tk.END)
         self.terminal_box.delete("1.0", tk.END)
@@ -731,239 +2983,232 @@ class AssemblerApp:
             self.root.update()
 
     def assemble_all(self):
-        asm = self.input_box.get("1.0", tk.END).strip().splitlines()
+        self.profiler.reset()
+        self.profiler.cpu = self.profiler.memory = self.deep_profile_var.get()
+        with self.profiler.capture():
+            self.assemble_and_render()
+        self.status_var.set(self.profiler.status_line())
+
+    def assemble_and_render(self):
+        self.debug_pause()
+        asm = self.input_box.get("1.0", "end-1c").splitlines()
         self.output_box.delete("1.0", tk.END)
         self.terminal_box.delete("1.0", tk.END)
         self.copy_menu["menu"].delete(0, "end")
         self.assembled = []
         self.hex_map = {}
 
-        labels = {}
-        pc = 0
-
-        for line_num, line in enumerate(asm):
-            original_line = line.strip()
-            line_clean = re.sub(r'#.*', '', original_line).strip()
-
-            if not line_clean:
-                continue
-
-            if ':' in line_clean:
-                label_part, rest = line_clean.split(':', 1)
-                label_part = label_part.strip()
-                labels[label_part] = pc
-                line_clean = rest.strip()
-
-            if not line_clean:
-                continue
-
-            parts = self.parse_inst(line_clean)
-            if parts:
-                _mem = parts[0]
-                if self.architecture == "MIPS" and _mem == 'blt':
-                    pc += 8
-                else:
-                    if self.architecture == "RISC-V" and _mem == 'jal' and parts[1] == 'x0':
-                        pc += 4
-                    else:
-                        pc += 4
-
-        pc = 0
-        registers = {reg: 0 for reg in self.REGS}
-        memory = {}
-
-        for line_num, line in enumerate(asm):
-            original_line_for_output = line.strip()
-            line_clean = re.sub(r'#.*', '', line).strip()
-
-            if not line_clean:
-                continue
-
-            if ':' in line_clean:
-                line_clean = line_clean.split(':', 1)[1].strip()
-                if not line_clean:
-                    continue
+        program = self.assemble_program(asm, self.optimize_var.get())
+        errors = dict(program.errors)
+        removed = set(program.removed)
+        line_codes = {}
+        for pc in sorted(program.source_map):
+            line_codes.setdefault(program.source_map[pc], []).append(program.words[pc // 4])
+
+        with self.profiler.phase("render"):
+            for line_num, line in enumerate(asm):
+                original_line_for_output = line.strip()
+                if line_num in errors:
+                    self.assembled.append(f'{original_line_for_output} => ERROR: {errors[line_num]}')
+                elif line_num in line_codes:
+                    hex_code = '; '.join(f'0x{c:08x}' for c in line_codes[line_num])
+                    self.assembled.append(f'{original_line_for_output} => {hex_code}')
+                    self.hex_map[original_line_for_output] = hex_code
+                    self.copy_menu["menu"].add_command(
+                        label=original_line_for_output,
+                        command=lambda l=original_line_for_output: self.selected_var.set(l)
+                    )
+                elif line_num in removed:
+                    self.assembled.append(f'{original_line_for_output} => (removed by optimizer)')
+
+            self.output_box.insert(tk.END, '\n'.join(self.assembled))
+
+        # The program runs in the debugger's time slices rather than here,
+        # so programs that never halt don't freeze the window
+        self.debug_note = f'Optimizer removed {len(program.removed)} instruction(s)' \
+            if self.optimize_var.get() else ""
+        self.program = program
+        if self.load_program():
+            self.debug_run(max_cycles=self.ASSEMBLE_RUN_LIMIT)
+
+    def debug_reset(self):
+        self.debug_pause()
+        self.profiler.reset()
+        asm = self.input_box.get("1.0", "end-1c").splitlines()
+        self.program = self.assemble_program(asm, self.optimize_var.get())
+        self.debug_note = ""
+        return self.load_program()
+
+    def load_program(self):
+        self.simulator = None
+        self.line_to_pc = {}
+
+        if self.program.errors:
+            self.terminal_box.delete("1.0", tk.END)
+            for line_num, error in self.program.errors:
+                self.terminal_box.insert(tk.END, f'Line {line_num + 1}: ERROR: {error}\n')
+            self.input_box.tag_remove('debug_pc', "1.0", tk.END)
+            return False
+
+        for pc in sorted(self.program.source_map):
+            self.line_to_pc.setdefault(self.program.source_map[pc], pc)
+        self.simulator = Simulator(self, self.program.words)
+
+        self.breakpoint_lines &= set(self.line_to_pc)
+        for line_num in self.breakpoint_lines:
+            self.simulator.set_breakpoint(self.line_to_pc[line_num])
+        for addr in self.watch_addrs:
+            self.simulator.set_watchpoint(addr)
+        self.refresh_debug_view()
+        return True
+
+    def debug_run(self, stop_at=None, max_cycles=None):
+        if self.simulator is None and not self.debug_reset():
+            return
+        if self.simulator.halted:
+            return
+        self.debug_limit = None if max_cycles is None else self.simulator.cycles + max_cycles
+        if stop_at == self.simulator.pc:
+            # Already at the cursor: run until it is reached again
+            self.simulator.breakpoint_stop = (stop_at, self.simulator.cycles)
+        self.debug_stop_at = stop_at
+        if not self.debug_running:
+            self.debug_running = True
+            self.debug_after_id = self.root.after(1, self.debug_tick)
+
+    def debug_pause(self):
+        self.debug_running = False
+        if self.debug_after_id is not None:
+            self.root.after_cancel(self.debug_after_id)
+            self.debug_after_id = None
+        if self.simulator is not None:
+            self.refresh_debug_view()
+
+    def debug_step(self):
+        if self.simulator is None and not self.debug_reset():
+            return
+        self.debug_pause()
+        try:
+            self.simulator.step()
+        except ValueError as e:
+            self.simulator.halted = True
+            messagebox.showerror("Simulation Error", str(e))
+        self.refresh_debug_view()
+
+    def cursor_instruction_line(self):
+        cursor_line = int(self.input_box.index(tk.INSERT).split('.')[0]) - 1
+        later_lines = [line for line in self.line_to_pc if line >= cursor_line]
+        if not later_lines:
+            messagebox.showwarning("Warning", "No instruction at or after the cursor")
+            return None
+        return min(later_lines)
 
-            parts = self.parse_inst(line_clean)
-            if not parts:
-                continue
+    def debug_run_to_cursor(self):
+        if self.simulator is None and not self.debug_reset():
+            return
+        line_num = self.cursor_instruction_line()
+        if line_num is not None:
+            self.debug_run(stop_at=self.line_to_pc[line_num])
 
-            try:
-                current_pc_for_branch_target = pc
+    def toggle_breakpoint(self):
+        if self.simulator is None and not self.debug_reset():
+            return
+        line_num = self.cursor_instruction_line()
+        if line_num is None:
+            return
+        enabled = line_num not in self.breakpoint_lines
+        if enabled:
+            self.breakpoint_lines.add(line_num)
+        else:
+            self.breakpoint_lines.discard(line_num)
+        self.simulator.set_breakpoint(self.line_to_pc[line_num], enabled)
+        self.refresh_debug_view()
 
-                code = self.encode_inst(parts, labels, current_pc_for_branch_target)
+    def toggle_watchpoint(self):
+        if self.simulator is None and not self.debug_reset():
+            return
+        answer = simpledialog.askstring("Watchpoint", "Memory address to watch (add or remove):", parent=self.root)
+        if not answer:
+            return
+        try:
+            addr = int(answer, 0)
+            enabled = addr not in self.watch_addrs
+            self.simulator.set_watchpoint(addr, enabled)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid watchpoint address: {e}")
+            return
+        if enabled:
+            self.watch_addrs.add(addr)
+        else:
+            self.watch_addrs.discard(addr)
+        self.refresh_debug_view()
 
-                if isinstance(code, tuple):
-                    hex_codes = []
-                    for c in code:
-                        hex_codes.append(f'0x{c:08x}')
-                    hex_code = '; '.join(hex_codes)
-                    self.assembled.append(f'{original_line_for_output} => {hex_code}')
-                    self.hex_map[original_line_for_output] = hex_code
-                    pc += len(code) * 4
-                else:
-                    hex_code = f'0x{code:08x}'
-                    self.assembled.append(f'{original_line_for_output} => {hex_code}')
-                    self.hex_map[original_line_for_output] = hex_code
-                    pc += 4
-
-                self.copy_menu["menu"].add_command(
-                    label=original_line_for_output,
-                    command=lambda l=original_line_for_output: self.selected_var.set(l)
-                )
-
-                _mem = parts[0]
-                if _mem == 'addi':
-                    rd, rs1, imm = parts[1], parts[2], int(parts[3])
-                    registers[rd] = self.sign_extend(registers.get(rs1, 0) + imm, 32)
-                elif _mem == 'add':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = self.sign_extend(registers.get(rs1, 0) + registers.get(rs2, 0), 32)
-                elif _mem == 'sub':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = self.sign_extend(registers.get(rs1, 0) - registers.get(rs2, 0), 32)
-                elif _mem == 'mul':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = self.sign_extend(registers.get(rs1, 0) * registers.get(rs2, 0), 32)
-                elif _mem == 'sll':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                        shift_amount = registers.get(rs2, 0) % 32
-                        registers[rd] = (registers.get(rs1, 0) << shift_amount) & 0xFFFFFFFF
-                    elif self.architecture == "MIPS":
-                        rd, rt, shamt = parts[1], parts[2], int(parts[3])
-                        shift_amount = shamt % 32
-                        registers[rd] = (registers.get(rt, 0) << shift_amount) & 0xFFFFFFFF
-                elif _mem == 'srl':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                        shift_amount = registers.get(rs2, 0) % 32
-                        registers[rd] = (registers.get(rs1, 0) >> shift_amount) & 0xFFFFFFFF
-                    elif self.architecture == "MIPS":
-                        rd, rt, shamt = parts[1], parts[2], int(parts[3])
-                        shift_amount = shamt % 32
-                        registers[rd] = (registers.get(rt, 0) >> shift_amount) & 0xFFFFFFFF
-                elif _mem == 'sra':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                        shift_amount = registers.get(rs2, 0) % 32
-                        val = self.sign_extend(registers.get(rs1, 0), 32)
-                        registers[rd] = (val >> shift_amount)
-                        registers[rd] &= 0xFFFFFFFF
-                    elif self.architecture == "MIPS":
-                        rd, rt, shamt = parts[1], parts[2], int(parts[3])
-                        shift_amount = shamt % 32
-                        val = self.sign_extend(registers.get(rt, 0), 32)
-                        registers[rd] = (val >> shift_amount)
-                        registers[rd] &= 0xFFFFFFFF
-                elif _mem == 'slt':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                        val1 = self.sign_extend(registers.get(rs1, 0), 32)
-                        val2 = self.sign_extend(registers.get(rs2, 0), 32)
-                        registers[rd] = 1 if val1 < val2 else 0
-                    elif self.architecture == "MIPS":
-                        rd, rs, rt = parts[1], parts[2], parts[3]
-                        val1 = self.sign_extend(registers.get(rs, 0), 32)
-                        val2 = self.sign_extend(registers.get(rt, 0), 32)
-                        registers[rd] = 1 if val1 < val2 else 0
-                elif _mem == 'sltu':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                        val1 = registers.get(rs1, 0)
-                        val2 = registers.get(rs2, 0)
-                        registers[rd] = 1 if val1 < val2 else 0
-                elif _mem == 'xor':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = (registers.get(rs1, 0) ^ registers.get(rs2, 0)) & 0xFFFFFFFF
-                elif _mem == 'or':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = (registers.get(rs1, 0) | registers.get(rs2, 0)) & 0xFFFFFFFF
-                elif _mem == 'and':
-                    rd, rs1, rs2 = parts[1], parts[2], parts[3]
-                    registers[rd] = (registers.get(rs1, 0) & registers.get(rs2, 0)) & 0xFFFFFFFF
-                elif _mem == 'lw':
-                    target_reg_name = parts[1]
-                    base_reg_name = parts[2]
-                    offset_val = int(parts[3])
-
-                    addr = (registers.get(base_reg_name, 0) + offset_val)
-                    if addr % 4 != 0:
-                        raise ValueError(f"Unaligned memory access at address {addr}")
-                    registers[target_reg_name] = memory.get(addr, 0)
-                elif _mem == 'sw':
-                    src_reg_name = parts[1]
-                    base_reg_name = parts[2]
-                    offset_val = int(parts[3])
-
-                    addr = (registers.get(base_reg_name, 0) + offset_val)
-                    if addr % 4 != 0:
-                        raise ValueError(f"Unaligned memory access at address {addr}")
-                    memory[addr] = registers.get(src_reg_name, 0)
-                elif _mem == 'jal':
-                    if self.architecture == "RISC-V":
-                        rd = parts[1]
-                        label = parts[2]
-                        registers[rd] = pc
-                        pc = labels[label]
-                    else:
-                        label = parts[1]
-                        registers['$ra'] = pc
-                        pc = labels[label]
-                elif _mem == 'j':
-                    if self.architecture == "RISC-V":
-                        label = parts[2]
-                        pc = labels[label]
-                    else:
-                        label = parts[1]
-                        pc = labels[label]
-                elif _mem == 'jalr':
-                    if self.architecture == "RISC-V":
-                        rd, rs1, imm = parts[1], parts[2], int(parts[3])
-                        registers[rd] = pc
-                        pc = (registers.get(rs1, 0) + imm)
-                elif _mem == 'beq':
-                    rs1, rs2, label = parts[1], parts[2], parts[3]
-                    if registers.get(rs1, 0) == registers.get(rs2, 0):
-                        pc = labels[label]
-                elif _mem == 'blt':
-                    if self.architecture == "RISC-V":
-                        rs1, rs2, label = parts[1], parts[2], parts[3]
-                        val1 = self.sign_extend(registers.get(rs1, 0), 32)
-                        val2 = self.sign_extend(registers.get(rs2, 0), 32)
-                        if val1 < val2:
-                            pc = labels[label]
-                    else:
-                        rs1, rt, label = parts[1], parts[2], parts[3]
-                        val1 = self.sign_extend(registers.get(rs1, 0), 32)
-                        val2 = self.sign_extend(registers.get(rt, 0), 32) # Corrected from rs2 to rt
-                        if val1 < val2:
-                            pc = labels[label]
-                elif _mem == 'jr':
-                    rs = parts[1]
-                    pc = registers.get(rs, 0)
-            except Exception as e:
-                self.assembled.append(f'{original_line_for_output} => ERROR: {e}')
-                if self.architecture == "MIPS" and parts[0] == 'blt':
-                    pc += 8
-                else:
-                    pc += 4
+    def debug_tick(self):
+        self.debug_after_id = None
+        if not self.debug_running:
+            return
 
-        if self.architecture == "RISC-V":
-            sorted_regs = sorted(registers.keys(), key=lambda x: int(x[1:]))
+        sim = self.simulator
+        deadline = time.perf_counter() + self.DEBUG_SLICE
+        try:
+            while time.perf_counter() < deadline:
+                batch = self.DEBUG_BATCH
+                if self.debug_limit is not None:
+                    batch = min(batch, self.debug_limit - sim.cycles)
+                steps = sim.run(batch, self.debug_stop_at)
+                if sim.halted or steps < batch or \
+                        (self.debug_limit is not None and sim.cycles >= self.debug_limit):
+                    self.debug_running = False
+                    break
+        except ValueError as e:
+            sim.halted = True
+            self.debug_running = False
+            messagebox.showerror("Simulation Error", str(e))
+
+        if self.debug_running:
+            if time.monotonic() - self.last_debug_refresh >= self.DEBUG_REFRESH:
+                self.refresh_debug_view()
+            self.debug_after_id = self.root.after(1, self.debug_tick)
         else:
-            sorted_regs = sorted(self.REGS.keys(), key=lambda x: self.REGS[x])
+            self.refresh_debug_view()
+
+    def refresh_debug_view(self):
+        sim = self.simulator
+        self.last_debug_refresh = time.monotonic()
+
+        if sim.halted:
+            state = "halted"
+        elif self.debug_running:
+            state = "running"
+        elif sim.stop_reason:
+            state = f"stopped at {sim.stop_reason}"
+        else:
+            state = "paused"
+        lines = [self.debug_note, ''] if self.debug_note else []
+        lines += [f'pc = 0x{sim.pc:08x} ({state}, {sim.cycles} cycles)', '']
+        if self.watch_addrs:
+            lines.append('Watching: ' + ', '.join(f'[{addr}]' for addr in sorted(self.watch_addrs)))
+            lines.append('')
+        for r in sorted(self.REGS, key=self.REGS.get):
+            lines.append(f'{r} = {sim.regs[self.REGS[r]]}')
+        if sim.memory:
+            lines.append('\nMemory:')
+            for addr in sorted(sim.memory):
+                lines.append(f'[{addr}] = 0x{sim.memory[addr]:08x}')
 
-        for r in sorted_regs:
-            val = registers[r]
-            self.terminal_box.insert(tk.END, f'{r} = {val}\n')
+        self.terminal_box.delete("1.0", tk.END)
+        self.terminal_box.insert(tk.END, '\n'.join(lines))
+        self.status_var.set(self.profiler.status_line())
 
-        if memory:
-            self.terminal_box.insert(tk.END, '\nMemory:\n')
-            for addr in sorted(memory):
-                self.terminal_box.insert(tk.END, f'[{addr}] = 0x{memory[addr]:08x}\n')
+        self.input_box.tag_remove('debug_bp', "1.0", tk.END)
+        for line_num in self.breakpoint_lines:
+            self.input_box.tag_add('debug_bp', f"{line_num + 1}.0", f"{line_num + 1}.end")
 
-        self.output_box.insert(tk.END, '\n'.join(self.assembled))
+        self.input_box.tag_remove('debug_pc', "1.0", tk.END)
+        line_num = self.program.source_map.get(sim.pc)
+        if line_num is not None and not sim.halted:
+            self.input_box.tag_add('debug_pc', f"{line_num + 1}.0", f"{line_num + 1}.end")
+            self.input_box.see(f"{line_num + 1}.0")
 
 def show_arch_selection():
     root = tk.Tk()
@@ -975,8 +3220,446 @@ def show_arch_selection():
         app = AssemblerApp(root, selection_window.selected_arch)
         root.mainloop()
 
-def main():
-    show_arch_selection()
+# Service wire format: every message is a 4-byte big-endian length followed
+# by that many bytes of UTF-8 JSON. Responses echo the request's "id" and
+# may arrive out of order when a connection has several requests in flight.
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_service = None
+
+def encode_frame(message):
+    data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return len(data).to_bytes(4, "big") + data
+
+def init_service(cache_dir=None, use_cache=True):
+    global _service
+    _service = AssemblerService(cache_dir, use_cache)
+
+def handle_service_request(request):
+    if _service is None:
+        init_service()
+    try:
+        return _service.handle(request)
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+async def serve(socket_path=None, port=8765, jobs=None, cache_dir=None, use_cache=True):
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_service,
+                                   initargs=(cache_dir, use_cache))
+
+    async def handle_connection(reader, writer):
+        write_lock = asyncio.Lock()
+        pending = set()
+
+        async def answer(request):
+            response = await loop.run_in_executor(executor, handle_service_request, request)
+            response["id"] = request.get("id")
+            async with write_lock:
+                writer.write(encode_frame(response))
+                await writer.drain()
+
+        try:
+            while True:
+                length = int.from_bytes(await reader.readexactly(4), "big")
+                if length > MAX_FRAME_BYTES:
+                    break
+                try:
+                    request = json.loads(await reader.readexactly(length))
+                except ValueError as e:
+                    request = {"op": "invalid", "error": str(e)}
+                if not isinstance(request, dict):
+                    request = {"op": "invalid"}
+                task = asyncio.ensure_future(answer(request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    if socket_path:
+        server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(handle_connection, "127.0.0.1", port)
+        where = f"127.0.0.1:{port}"
+    print(f"Serving on {where}", flush=True)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def write_hex(path, words):
+    with open(path, "w") as f:
+        for word in words:
+            f.write(f"{word:08x}\n")
+
+def read_hex(path):
+    with open(path, "r") as f:
+        return [int(line, 16) for line in f if line.strip()]
+
+@contextmanager
+def atomic_open(path, mode="w"):
+    # Writes to a temporary file next to path that replaces it only once
+    # complete. mkstemp creates files as 0600, so the result gets the mode
+    # a plain open() would have given it; on error the file is removed.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# Program images are a little-endian header, a section table and 4-byte
+# aligned section data:
+#   header:  magic[8] version:u16 arch:u16 base:u32 entry:u32 sections:u32
+#   section: name[8] addr:u32 offset:u32 size:u32
+# ".text" holds the instruction words exactly as the simulator reads them,
+# so loading is an mmap plus a memoryview cast. The optional ".srcmap" holds
+# one u32 source line per word (NO_LINE for words without one).
+IMAGE_MAGIC = b"MASMIMG\0"
+IMAGE_VERSION = 1
+NO_LINE = 0xFFFFFFFF
+IMAGE_HEADER = struct.Struct("<8sHHIII")
+IMAGE_SECTION = struct.Struct("<8sIII")
+IMAGE_ARCHS = ["RISC-V", "MIPS"]
+
+def write_image(path, architecture, words, base=0, entry=None, source_map=None):
+    sections = [(b".text", base, array("I", words))]
+    if sys.byteorder != "little":
+        sections[0][2].byteswap()
+    if source_map:
+        lines = array("I", [NO_LINE]) * (max(source_map) // 4 + 1)
+        for pc, line in source_map.items():
+            lines[pc // 4] = line
+        if sys.byteorder != "little":
+            lines.byteswap()
+        sections.append((b".srcmap", 0, lines))
+
+    offset = IMAGE_HEADER.size + IMAGE_SECTION.size * len(sections)
+    table = []
+    for name, addr, data in sections:
+        size = len(data) * getattr(data, "itemsize", 1)
+        offset = (offset + 3) & ~3
+        table.append(IMAGE_SECTION.pack(name, addr, offset, size))
+        offset += size
+
+    with atomic_open(path, "wb") as f:
+        f.write(IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, IMAGE_ARCHS.index(architecture),
+                                  base, base if entry is None else entry, len(sections)))
+        f.write(b"".join(table))
+        for name, addr, data in sections:
+            f.write(b"\0" * (-f.tell() & 3))
+            f.write(data)
+
+def load_image(path):
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"{path} is not a program image")
+    if len(data) < IMAGE_HEADER.size:
+        raise ValueError(f"{path} is not a program image")
+    magic, version, arch, base, entry, count = IMAGE_HEADER.unpack_from(data)
+    if magic != IMAGE_MAGIC:
+        raise ValueError(f"{path} is not a program image")
+    if version != IMAGE_VERSION or arch >= len(IMAGE_ARCHS):
+        raise ValueError(f"{path} has unsupported image version {version}")
+    if IMAGE_HEADER.size + count * IMAGE_SECTION.size > len(data):
+        raise ValueError(f"{path}: section table is truncated")
+
+    sections = {}
+    for i in range(count):
+        name, addr, offset, size = IMAGE_SECTION.unpack_from(data, IMAGE_HEADER.size + i * IMAGE_SECTION.size)
+        name = name.rstrip(b"\0").decode()
+        if offset + size > len(data):
+            raise ValueError(f"{path}: section {name} is truncated")
+        sections[name] = (addr, offset, size)
+    if ".text" not in sections:
+        raise ValueError(f"{path} has no .text section")
+
+    _, offset, size = sections[".text"]
+    if size % 4:
+        raise ValueError(f"{path}: .text is not a whole number of words")
+    # words is the only reference to the mapping: it is unmapped once words
+    # is released (close_image) or garbage collected
+    words = memoryview(data)[offset:offset + size].cast("I")
+    if sys.byteorder != "little":
+        words = array("I", words)
+        words.byteswap()
+
+    source_map = None
+    if ".srcmap" in sections:
+        _, offset, size = sections[".srcmap"]
+        if size % 4:
+            raise ValueError(f"{path}: .srcmap is not a whole number of words")
+        lines = array("I", data[offset:offset + size])
+        if sys.byteorder != "little":
+            lines.byteswap()
+        source_map = {index * 4: line for index, line in enumerate(lines) if line != NO_LINE}
+    return ProgramImage(IMAGE_ARCHS[arch], base, entry, sections, words, source_map)
+
+def close_image(image):
+    if isinstance(image.words, memoryview):
+        image.words.release()
+
+def convert_file(path, architecture, output=None):
+    # .hex <-> .img, picked by the input's extension
+    if path.endswith(".hex"):
+        image_path = output or os.path.splitext(path)[0] + ".img"
+        words = read_hex(path)
+        write_image(image_path, architecture, words)
+        print(f"{path} -> {image_path}: {len(words)} words")
+    else:
+        image = load_image(path)
+        hex_path = output or os.path.splitext(path)[0] + ".hex"
+        write_hex(hex_path, image.words)
+        print(f"{path} -> {hex_path}: {len(image.words)} words ({image.architecture})")
+        close_image(image)
+    return 0
+
+def disassemble_file(path, architecture, output=None, profiler=None):
+    # .hex or .img -> source that assembles back to the same words
+    base, image = 0, None
+    if path.endswith(".hex"):
+        words = read_hex(path)
+    else:
+        image = load_image(path)
+        architecture, words, base = image.architecture, image.words, image.base
+    source = Assembler(architecture, profiler=profiler).disassemble_program(words, base)
+    if image:
+        close_image(image)
+    source_path = output or os.path.splitext(path)[0] + ".s"
+    with open(source_path, "w") as f:
+        f.write("\n".join(source) + "\n")
+    print(f"{path} -> {source_path}: {len(words)} words ({architecture})")
+    return 0
+
+def save_object(obj, path):
+    data = obj._asdict()
+    data["format"] = "mini-asm-object"
+    data["version"] = ASSEMBLER_VERSION
+    with atomic_open(path) as f:
+        json.dump(data, f, separators=(",", ":"))
+
+def load_object(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("format") != "mini-asm-object":
+        raise ValueError(f"{path} is not an object file")
+    if data.get("version") != ASSEMBLER_VERSION:
+        raise ValueError(f"{path} was written by assembler version {data.get('version')}")
+    data["source_map"] = {int(pc): line_num for pc, line_num in data["source_map"].items()}
+    data["errors"] = [tuple(error) for error in data["errors"]]
+    return ObjectFile(*(data[field] for field in ObjectFile._fields))
+
+def compile_object(assembler, source, optimize=False):
+    # Returns (object, rebuilt); an object file next to the source is
+    # reused as long as it was built from the same text
+    obj_path = os.path.splitext(source)[0] + ".o"
+    with open(source, "r") as f:
+        asm = f.read().splitlines()
+
+    source_hash = BuildCache.key("\n".join(asm), assembler.architecture, optimize)
+    if os.path.exists(obj_path):
+        try:
+            obj = load_object(obj_path)
+            if obj.source_hash == source_hash:
+                return obj, False
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    name = os.path.splitext(os.path.basename(source))[0]
+    obj = assembler.assemble_object(asm, name, optimize)
+    if not obj.errors:
+        save_object(obj, obj_path)
+    return obj, True
+
+def write_output(path, architecture, words, image_format=False, source_map=None):
+    if image_format:
+        write_image(path, architecture, words, source_map=source_map)
+    else:
+        write_hex(path, words)
+
+def link_files(sources, architecture, output=None, optimize=False, image_format=False, profiler=None):
+    assembler = Assembler(architecture, profiler=profiler)
+    profiler = assembler.profiler
+    linker = Linker(architecture)
+    rebuilt = 0
+
+    for source in sources:
+        if source.endswith(".o"):
+            obj = load_object(source)
+        else:
+            obj, fresh = compile_object(assembler, source, optimize)
+            rebuilt += fresh
+        linker.add(obj)
+
+    with profiler.phase("link"):
+        image = linker.link()
+    if image.errors:
+        for error in image.errors:
+            print(f"error: {error}", file=sys.stderr)
+        return 1
+
+    out_path = output or os.path.splitext(sources[0])[0] + (".img" if image_format else ".hex")
+    with profiler.phase("write"):
+        write_output(out_path, architecture, image.words, image_format)
+    print(f"{out_path}: {len(image.words)} words from {len(sources)} modules ({rebuilt} reassembled)")
+    return 0
+
+def assemble_files(sources, architecture, output=None, optimize=False, cache=None, image_format=False,
+                   profiler=None):
+    assembler = Assembler(architecture, cache, profiler)
+    profiler = assembler.profiler
+    status = 0
+
+    for source in sources:
+        with profiler.phase("read"):
+            with open(source, "r") as f:
+                asm = f.read().splitlines()
+        hits = cache.hits if cache else 0
+        program = assembler.assemble_program(asm, optimize)
+
+        if program.errors:
+            for line_num, error in program.errors:
+                print(f"{source}:{line_num + 1}: error: {error}", file=sys.stderr)
+            status = 1
+            continue
+
+        out_path = output or os.path.splitext(source)[0] + (".img" if image_format else ".hex")
+        with profiler.phase("write"):
+            write_output(out_path, architecture, program.words, image_format, program.source_map)
+        cached = " (cached)" if cache and cache.hits > hits else ""
+        print(f"{source} -> {out_path}: {len(program.words)} words{cached}")
+
+    return status
+
+def report_cycles(sources, architecture, optimize=False, profiler=None):
+    assembler = Assembler(architecture, profiler=profiler)
+    status = 0
+    for source in sources:
+        with open(source, "r") as f:
+            asm = f.read().splitlines()
+        program = assembler.assemble_program(asm, optimize)
+        if program.errors:
+            for line_num, error in program.errors:
+                print(f"{source}:{line_num + 1}: error: {error}", file=sys.stderr)
+            status = 1
+            continue
+
+        with assembler.profiler.phase("estimate"):
+            estimates = CycleEstimator(assembler, program.words, program.source_map, asm,
+                                       program.labels).estimate()
+        print(f"{source}:")
+        for estimate in estimates:
+            if estimate.best == float('inf'):
+                summary = "never finishes"
+            else:
+                worst = "unbounded" if estimate.worst == float('inf') else estimate.worst
+                summary = f"best {estimate.best}, worst {worst} cycles"
+            print(f"  {estimate.name} @ 0x{estimate.entry:08x}: {summary}")
+            for header, bound in estimate.loops:
+                print(f"    loop 0x{header:08x}: " + (f"bound {bound[0]}..{bound[1]}" if bound else "no bound"))
+            for note in estimate.notes:
+                print(f"    note: {note}")
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="RISC-V / MIPS mini assembler. Starts the GUI when no source files are given.")
+    parser.add_argument("sources", nargs="*", help="assembly source files")
+    parser.add_argument("--arch", choices=["RISC-V", "MIPS"], default="RISC-V")
+    parser.add_argument("-o", "--output", help="output file (single source only)")
+    parser.add_argument("--format", choices=["hex", "image"], default="hex", help="output format")
+    parser.add_argument("--convert", action="store_true", help="convert .hex files to images and back")
+    parser.add_argument("--disassemble", action="store_true", help="write reassemblable source for .hex/.img files")
+    parser.add_argument("--optimize", action="store_true", help="run the peephole optimizer")
+    parser.add_argument("--no-cache", action="store_true", help="always reassemble")
+    parser.add_argument("--cache-dir", help="build cache directory")
+    parser.add_argument("-c", "--compile", action="store_true", help="write relocatable .o files instead of hex")
+    parser.add_argument("--link", action="store_true", help="link the sources and .o files into one image")
+    parser.add_argument("--wcet", action="store_true", help="report static best/worst cycle counts per function")
+    parser.add_argument("--serve", action="store_true", help="run the assemble/simulate service")
+    parser.add_argument("--socket", help="Unix socket path for --serve (default: localhost TCP)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port for --serve")
+    parser.add_argument("--jobs", type=int, help="service worker processes")
+    parser.add_argument("--generate", type=int, metavar="N", help="write a random program of about N instructions")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --generate")
+    parser.add_argument("--profile", action="store_true", help="print per-phase timings to stderr")
+    parser.add_argument("--profile-cpu", action="store_true", help="add a cProfile report to --profile")
+    parser.add_argument("--profile-memory", action="store_true", help="add a tracemalloc report to --profile")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        try:
+            asyncio.run(serve(args.socket, args.port, args.jobs, args.cache_dir, not args.no_cache))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.generate is not None:
+        source = "\n".join(ProgramGenerator(args.arch, args.seed).generate(args.generate)) + "\n"
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(source)
+        else:
+            sys.stdout.write(source)
+        return 0
+    if not args.sources:
+        show_arch_selection()
+        return 0
+
+    profiler = Profiler(args.profile_cpu, args.profile_memory)
+    with profiler.capture():
+        status = run_build(parser, args, profiler)
+    if args.profile or args.profile_cpu or args.profile_memory:
+        print(profiler.summary(), file=sys.stderr)
+    return status
+
+def run_build(parser, args, profiler):
+    image_format = args.format == "image"
+    if args.convert:
+        for source in args.sources:
+            convert_file(source, args.arch, args.output)
+        return 0
+    if args.disassemble:
+        for source in args.sources:
+            disassemble_file(source, args.arch, args.output, profiler)
+        return 0
+    if args.wcet:
+        return report_cycles(args.sources, args.arch, args.optimize, profiler)
+    if args.link:
+        return link_files(args.sources, args.arch, args.output, args.optimize, image_format, profiler)
+    if args.compile:
+        assembler = Assembler(args.arch, profiler=profiler)
+        status = 0
+        for source in args.sources:
+            obj, rebuilt = compile_object(assembler, source, args.optimize)
+            for line_num, error in obj.errors:
+                print(f"{source}:{line_num + 1}: error: {error}", file=sys.stderr)
+                status = 1
+            if not obj.errors:
+                print(f"{source}: {len(obj.words)} words, {len(obj.relocations)} relocations" +
+                      ("" if rebuilt else " (up to date)"))
+        return status
+    if args.output and len(args.sources) > 1:
+        parser.error("-o/--output needs a single source file")
+
+    cache = None if args.no_cache else BuildCache(args.cache_dir)
+    return assemble_files(args.sources, args.arch, args.output, args.optimize, cache, image_format, profiler)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
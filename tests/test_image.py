@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mainAssemble import Assembler, atomic_open, close_image, compile_object, load_image, write_image
+
+
+@pytest.fixture
+def umask_022():
+    old = os.umask(0o022)
+    yield
+    os.umask(old)
+
+
+def test_image_round_trip_with_umask_mode(tmp_path, umask_022):
+    path = str(tmp_path / "prog.img")
+    write_image(path, "RISC-V", [1, 2, 3], source_map={0: 0, 4: 1, 8: 1})
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    image = load_image(path)
+    assert list(image.words) == [1, 2, 3]
+    assert image.source_map == {0: 0, 4: 1, 8: 1}
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "prog.img"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_open(str(path), "wb") as f:
+            f.write(b"partial")
+            raise RuntimeError("disk full")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["prog.img"]
+
+
+def test_object_files_get_umask_mode(tmp_path, umask_022):
+    source = tmp_path / "prog.s"
+    source.write_text("addi x1, x0, 1\n")
+    obj, rebuilt = compile_object(Assembler("RISC-V"), str(source))
+    assert rebuilt and not obj.errors
+    assert os.stat(tmp_path / "prog.o").st_mode & 0o777 == 0o644
+
+
+def test_source_map_is_packed(tmp_path):
+    path = str(tmp_path / "prog.img")
+    words = list(range(2000))
+    source_map = {pc: pc // 8 for pc in range(0, 8000, 4) if pc != 40}
+    write_image(path, "MIPS", words, source_map=source_map)
+    image = load_image(path)
+    assert image.source_map == source_map
+    assert os.path.getsize(path) <= 64 + 8 * len(words)
+
+
+def test_close_image_releases_words(tmp_path):
+    path = str(tmp_path / "prog.img")
+    write_image(path, "RISC-V", [1, 2, 3])
+    image = load_image(path)
+    close_image(image)
+    with pytest.raises(ValueError):
+        image.words[0]
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mainAssemble import Assembler, Simulator, link_files, read_hex
+
+MAIN = ["jal x1, g", "ecall"]
+LIB = [
+    ".globl f, g",
+    "f:",
+    "addi x10, x10, 1",
+    "jalr x0, 0(x1)",
+    "g:",
+    "addi x10, x10, 2",
+    "jalr x0, 0(x1)",
+]
+
+
+def run_linked(tmp_path, modules, optimize):
+    sources = []
+    for name, asm in modules:
+        path = tmp_path / name
+        path.write_text("\n".join(asm) + "\n")
+        sources.append(str(path))
+    output = str(tmp_path / ("optimized.hex" if optimize else "plain.hex"))
+    assert link_files(sources, "RISC-V", output, optimize) == 0
+    sim = Simulator(Assembler("RISC-V"), read_hex(output))
+    sim.run(1000)
+    return sim
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_linked_call_into_exported_function(tmp_path, optimize):
+    sim = run_linked(tmp_path, [("main.s", MAIN), ("lib.s", LIB)], optimize)
+    assert sim.halted
+    assert sim.regs[10] == 2
+
+
+def test_optimizer_keeps_exported_functions(tmp_path):
+    plain = run_linked(tmp_path, [("main.s", MAIN), ("lib.s", LIB)], False)
+    optimized = run_linked(tmp_path, [("main.s", MAIN), ("lib.s", LIB)], True)
+    assert optimized.regs == plain.regs
+    assert optimized.memory == plain.memory
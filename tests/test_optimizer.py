@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mainAssemble import Assembler, Simulator, ProgramGenerator
+
+MAX_STEPS = 200000
+
+
+def simulate(assembler, asm, optimize):
+    program = assembler.assemble_program(asm, optimize)
+    assert not program.errors
+    sim = Simulator(assembler, program.words)
+    sim.run(MAX_STEPS)
+    return sim
+
+
+def assert_same_behaviour(architecture, asm, compare_regs=True):
+    # Removing code moves return addresses, so programs that make calls
+    # are compared on what they leave in memory
+    assembler = Assembler(architecture)
+    plain = simulate(assembler, asm, False)
+    optimized = simulate(assembler, asm, True)
+    assert optimized.halted == plain.halted
+    assert optimized.memory == plain.memory
+    if compare_regs:
+        assert optimized.regs == plain.regs
+
+
+@pytest.mark.parametrize("architecture", ["RISC-V", "MIPS"])
+@pytest.mark.parametrize("seed", range(40))
+def test_optimizer_preserves_generated_programs(architecture, seed):
+    assert_same_behaviour(architecture, ProgramGenerator(architecture, seed).generate(300), compare_regs=False)
+
+
+def test_branch_on_zero_register_is_kept():
+    assert_same_behaviour("MIPS", [
+        "addi $t0, $zero, 0",
+        "addi $t1, $zero, 5",
+        "loop:",
+        "addi $t0, $t0, 1",
+        "beq $t0, $t1, done",
+        "beq $zero, $zero, loop",
+        "done:",
+    ])
+
+
+@pytest.mark.parametrize("base", ["auipc x5, 0", "li x5, 12"])
+def test_computed_jump_target_is_kept(base):
+    # The redundant addi sits before the computed target, so removing it
+    # would move the target
+    assert_same_behaviour("RISC-V", [
+        base,
+        "addi x1, x1, 0",
+        "jalr x0, 12(x5)" if base.startswith("auipc") else "jalr x0, 0(x5)",
+        "addi x6, x0, 1",
+        "addi x7, x0, 2",
+    ])
+
+
+@pytest.mark.parametrize("branch", ["blt", "bltu"])
+def test_numeric_branch_offsets_disable_the_optimizer(branch):
+    assert_same_behaviour("RISC-V", [
+        "addi x1, x0, 1",
+        "addi x2, x0, 2",
+        f"{branch} x1, x2, 12",
+        "addi x3, x3, 0",
+        "addi x5, x0, 9",
+        "addi x5, x0, 5",
+    ])
+
+
+@pytest.mark.parametrize("architecture, call, regs", [
+    ("RISC-V", "jal x1, 12", ["x5", "x6", "x0"]),
+    ("RISC-V", "call 12", ["x5", "x6", "x0"]),
+    ("MIPS", "jal 0xc", ["$t0", "$t1", "$zero"]),
+    ("MIPS", "call 0xc", ["$t0", "$t1", "$zero"]),
+])
+def test_numeric_call_targets_disable_the_optimizer(architecture, call, regs):
+    first, second, zero = regs
+    assert_same_behaviour(architecture, [
+        call,
+        f"addi {first}, {first}, 0",
+        f"addi {first}, {zero}, 9",
+        f"addi {second}, {zero}, 5",
+    ])
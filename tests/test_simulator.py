@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mainAssemble import Assembler, Simulator
+
+LOOP = [
+    "addi x1, x0, 100",
+    "loop:",
+    "addi x2, x2, 1",
+    "addi x1, x1, -1",
+    "bne x1, x0, loop",
+]
+
+
+def loop_simulator():
+    assembler = Assembler("RISC-V")
+    program = assembler.assemble_program(LOOP)
+    sim = Simulator(assembler, program.words)
+    sim.set_breakpoint(program.labels["loop"])
+    return sim
+
+
+def count_stops(sim, batch):
+    stops = 0
+    while not sim.halted:
+        sim.run(batch)
+        if sim.stop_reason == "breakpoint":
+            stops += 1
+    return stops
+
+
+def test_breakpoint_stops_every_iteration():
+    assert count_stops(loop_simulator(), 1000) == 100
+
+
+def test_batches_ending_on_a_breakpoint_still_stop():
+    sim = loop_simulator()
+    sim.run(1)
+    assert sim.pc == 4 and sim.stop_reason is None
+    assert count_stops(sim, 3) == 100
+
+
+def test_run_to_cursor_stops_at_the_cursor():
+    sim = loop_simulator()
+    sim.set_breakpoint(4, False)
+    sim.run(1000, stop_at=4)
+    assert sim.stop_reason == "breakpoint" and sim.pc == 4 and sim.cycles == 1
+
+
+def test_run_to_cursor_batches_ending_on_the_cursor_still_stop():
+    sim = loop_simulator()
+    sim.set_breakpoint(4, False)
+    sim.run(1)
+    sim.run(3, stop_at=4)
+    assert sim.stop_reason == "breakpoint" and sim.cycles == 1